@@ -0,0 +1,149 @@
+# Measure the vectorised history analytics at increasing history sizes:
+#   - throughput of streaming, computing and writing back metrics
+#   - peak resident memory, which should stay flat as the table grows
+# and compare against a row-by-row Python pass that loads everything at once.
+# Synthetic snapshots are written to video_history inside a transaction that
+# is always rolled back.
+# Usage: python -m benchmarks.analytics [--rows 1000000,2000000,4000000]
+import argparse
+import resource
+import time
+from collections import defaultdict, deque
+from datetime import date, timedelta
+
+from sqlalchemy import select, text
+
+from src.core.analytics import CHUNK_SIZE, WINDOW, analyse_history
+from src.database.database import engine
+from src.database.models import VideoHistory
+from src.database.partitions import ensure_partitions
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def create_snapshots(connection, rows, snapshots, end):
+    """
+    Write `rows` video snapshots, `snapshots` per video, one scrape per hour.
+    """
+    ensure_partitions(connection, start=end - timedelta(hours=snapshots + 24))
+    connection.execute(
+        text(
+            """
+            INSERT INTO video_history (
+                video_id, scraped_at, title, published_at, view_count, like_count,
+                comment_count, rank, scrape_type, region, channel_id, category_id
+            )
+            SELECT 'bench_' || v,
+                   CAST(:end AS timestamp) - s * interval '1 hour',
+                   'bench', CAST(:end AS timestamp) - interval '30 days',
+                   (v * 1000 + (:snapshots - s) * (v % 97 + 1) * 100),
+                   (v * 10 + (:snapshots - s) * (v % 13)),
+                   (v + (:snapshots - s)),
+                   (v + s) % 50 + 1, 'popular', 'US', 'channel_' || (v % 5000), 10
+            FROM generate_series(1, :videos) AS v,
+                 generate_series(1, :snapshots) AS s
+            """
+        ),
+        {"videos": rows // snapshots, "snapshots": snapshots, "end": end},
+    )
+    connection.execute(text("ANALYZE video_history"))
+
+
+def row_by_row(connection, window):
+    """
+    Previous approach for comparison: fetch every snapshot, then compute the
+    same metrics in a Python loop with a dict of per-series state.
+    """
+    history = VideoHistory.__table__
+    rows = connection.execute(
+        select(history).order_by(history.c.video_id, history.c.scraped_at)
+    ).all()
+    previous = {}
+    deltas = defaultdict(lambda: deque(maxlen=window))
+    metrics = []
+    for row in rows:
+        series = (row.video_id, row.region, row.scrape_type, row.scrape_category)
+        last = previous.get(series)
+        result = {"history_id": row.id, "scraped_at": row.scraped_at}
+        if last is not None:
+            delta = row.view_count - last.view_count
+            hours = (row.scraped_at - last.scraped_at).total_seconds() / 3600
+            result["view_count_delta"] = delta
+            result["rank_change"] = last.rank - row.rank
+            if last.view_count and hours:
+                result["view_growth_rate"] = delta / last.view_count / hours
+            deltas[series].append(delta)
+            result["view_delta_avg"] = sum(deltas[series]) / len(deltas[series])
+        previous[series] = row
+        metrics.append(result)
+    return len(metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark vectorised history analytics against history size."
+    )
+    parser.add_argument(
+        "--rows",
+        default="1000000,2000000,4000000",
+        help="Comma-separated history sizes to run",
+    )
+    parser.add_argument("--snapshots", type=int, default=48, help="Per video")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--baseline-rows",
+        type=int,
+        default=1_000_000,
+        help="History size for the row-by-row comparison, 0 to skip",
+    )
+    args = parser.parse_args()
+
+    end = date.today() + timedelta(days=1)
+    sizes = [int(size) for size in args.rows.split(",")]
+    print(f"Peak RSS before: {peak_rss_mb():.0f} MB")
+
+    for rows in sizes:
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                create_snapshots(connection, rows, args.snapshots, end)
+                for write in (False, True):
+                    start = time.perf_counter()
+                    analysed = analyse_history(
+                        connection,
+                        VideoHistory,
+                        chunk_size=args.chunk_size,
+                        write=write,
+                    )
+                    elapsed = time.perf_counter() - start
+                    print(
+                        f"vectorised, {rows} rows: {analysed / elapsed:.0f} rows/s "
+                        f"{'with' if write else 'without'} write-back, "
+                        f"peak RSS {peak_rss_mb():.0f} MB"
+                    )
+            finally:
+                transaction.rollback()
+
+    # Run last, as its memory would hide the vectorised runs' peak
+    if args.baseline_rows:
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                create_snapshots(connection, args.baseline_rows, args.snapshots, end)
+                start = time.perf_counter()
+                analysed = row_by_row(connection, WINDOW)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"row by row, {args.baseline_rows} rows: "
+                    f"{analysed / elapsed:.0f} rows/s without write-back, "
+                    f"peak RSS {peak_rss_mb():.0f} MB"
+                )
+            finally:
+                transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Compare the correlated-subquery channel aggregate update against the single-pass one.
+# Synthetic rows are written inside a transaction that is always rolled back,
+# so this can be pointed at a development database.
+# Usage: python -m benchmarks.channel_aggregates [--videos 100000] [--channels 2000]
+import argparse
+import statistics
+import time
+
+from sqlalchemy import distinct, func, select, text, update
+
+from src.database.database import channel_aggregates_statement, engine
+from src.database.models import Channels, VideoData
+
+
+def legacy_channel_aggregates_statement():
+    """
+    The previous channel aggregate update: one correlated subquery per column.
+    """
+    unique_videos = (
+        select(
+            VideoData.channel_id,
+            VideoData.video_id,
+            VideoData.like_count,
+            VideoData.comment_count,
+            VideoData.view_count,
+        )
+        .distinct(VideoData.channel_id, VideoData.video_id)
+        .subquery()
+    )
+
+    def correlated(aggregate):
+        return (
+            select(aggregate)
+            .where(unique_videos.c.channel_id == Channels.channel_id)
+            .correlate(Channels)
+            .scalar_subquery()
+        )
+
+    popular_count = (
+        select(func.count(distinct(VideoData.video_id)))
+        .where(VideoData.channel_id == Channels.channel_id)
+        .correlate(Channels)
+        .scalar_subquery()
+    )
+    return (
+        update(Channels)
+        .values(
+            like_count=correlated(func.sum(unique_videos.c.like_count)),
+            comment_count=correlated(func.sum(unique_videos.c.comment_count)),
+            popular_view_count=correlated(func.sum(unique_videos.c.view_count)),
+            average_views=correlated(func.avg(unique_videos.c.view_count)),
+            average_likes=correlated(func.avg(unique_videos.c.like_count)),
+            average_comments=correlated(func.avg(unique_videos.c.comment_count)),
+            popular_count=popular_count,
+        )
+        .where(Channels.channel_id == VideoData.channel_id)
+    )
+
+
+def populate(connection, videos, channels):
+    """
+    Insert synthetic channels and videos with server-side generate_series.
+    """
+    connection.execute(
+        text(
+            """
+            INSERT INTO channels (channel_id, title, published_at, view_count)
+            SELECT 'bench_channel_' || i, 'Channel ' || i, now(), i * 1000
+            FROM generate_series(1, :channels) AS i
+            """
+        ),
+        {"channels": channels},
+    )
+    # Every fourth video also appears in the popular chart, as in real scrapes
+    connection.execute(
+        text(
+            """
+            INSERT INTO video_data (video_id, title, published_at, view_count, like_count,
+                                    comment_count, scrape_type, scrape_category, rank, region,
+                                    channel_id)
+            SELECT 'bench_video_' || (i / 4 * 4), 'Video ' || i, now(),
+                   (random() * 1e7)::bigint, (random() * 1e5)::bigint, (random() * 1e4)::int,
+                   CASE WHEN i % 4 = 0 THEN 'popular' ELSE 'category' END::videotype,
+                   CASE WHEN i % 4 = 0 THEN NULL ELSE i % 4 END,
+                   i % 200 + 1, 'US', 'bench_channel_' || (i % :channels + 1)
+            FROM generate_series(1, :videos) AS i
+            """
+        ),
+        {"videos": videos, "channels": channels},
+    )
+    connection.execute(text("ANALYZE channels"))
+    connection.execute(text("ANALYZE video_data"))
+
+
+def time_statement(connection, statement, repeat, timeout):
+    """
+    Run a statement repeat times inside savepoints and return each duration.
+    Returns None if it exceeds the statement timeout.
+    """
+    durations = []
+    for _ in range(repeat):
+        savepoint = connection.begin_nested()
+        connection.execute(text(f"SET LOCAL statement_timeout = {int(timeout * 1000)}"))
+        start = time.perf_counter()
+        try:
+            connection.execute(statement)
+        except Exception:
+            savepoint.rollback()
+            return None
+        durations.append(time.perf_counter() - start)
+        savepoint.rollback()
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the channel aggregate update statements."
+    )
+    parser.add_argument("--videos", type=int, default=100_000)
+    parser.add_argument("--channels", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--timeout", type=float, default=300, help="Seconds before a run is abandoned"
+    )
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            populate(connection, args.videos, args.channels)
+            print(f"Populated {args.videos} videos across {args.channels} channels.")
+            for name, statement in [
+                ("correlated subqueries", legacy_channel_aggregates_statement()),
+                ("single pass", channel_aggregates_statement()),
+            ]:
+                durations = time_statement(
+                    connection, statement, args.repeat, args.timeout
+                )
+                if durations is None:
+                    print(f"{name}: exceeded {args.timeout:.0f}s timeout")
+                else:
+                    print(
+                        f"{name}: median {statistics.median(durations):.3f}s, "
+                        f"min {min(durations):.3f}s over {len(durations)} runs"
+                    )
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
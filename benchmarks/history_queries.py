@@ -0,0 +1,170 @@
+# Compare history queries on a heap table against monthly range partitions,
+# both with the same (entity id, scraped_at DESC) index so that only the
+# partitioning differs:
+#   - latest snapshot per video for a trending-sized set of videos, both as
+#     DISTINCT ON and as one LATERAL index probe per video
+#   - 30-day time series for one channel
+# Scratch tables are created inside a transaction that is always rolled back.
+# Usage: python -m benchmarks.history_queries [--rows 1000000] [--days 180]
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from src.database.database import engine
+from src.database.partitions import month_start
+
+# Sorts every snapshot of the requested videos
+LATEST_SNAPSHOTS = """
+    SELECT DISTINCT ON (entity_id) entity_id, scraped_at, view_count
+    FROM {table}
+    WHERE entity_id = ANY(:ids)
+    ORDER BY entity_id, scraped_at DESC
+"""
+# One index probe per video, reading only its newest row (in each partition)
+LATEST_SNAPSHOTS_LATERAL = """
+    SELECT ids.entity_id, latest.scraped_at, latest.view_count
+    FROM unnest(CAST(:ids AS text[])) AS ids(entity_id)
+    CROSS JOIN LATERAL (
+        SELECT scraped_at, view_count
+        FROM {table}
+        WHERE entity_id = ids.entity_id
+        ORDER BY scraped_at DESC
+        LIMIT 1
+    ) AS latest
+"""
+TIME_SERIES = """
+    SELECT scraped_at, view_count
+    FROM {table}
+    WHERE entity_id = :entity_id AND scraped_at >= :since
+    ORDER BY scraped_at
+"""
+
+
+def create_tables(connection, rows, entities, days, end):
+    """
+    Create and fill the heap and partitioned scratch tables with the same rows.
+    """
+    connection.execute(
+        text(
+            """
+            CREATE TABLE bench_history_heap (
+                id bigserial, entity_id text, scraped_at timestamp, view_count bigint
+            )
+            """
+        )
+    )
+    # Each entity is snapshotted at evenly spread times across the window
+    connection.execute(
+        text(
+            """
+            INSERT INTO bench_history_heap (entity_id, scraped_at, view_count)
+            SELECT 'entity_' || (i % :entities),
+                   CAST(:end AS timestamp) - (i * (:days * 86400.0 / :rows)) * interval '1 second',
+                   i
+            FROM generate_series(1, :rows) AS i
+            """
+        ),
+        {"rows": rows, "entities": entities, "days": days, "end": end},
+    )
+
+    connection.execute(
+        text(
+            """
+            CREATE TABLE bench_history_partitioned (
+                id bigserial, entity_id text, scraped_at timestamp, view_count bigint
+            ) PARTITION BY RANGE (scraped_at)
+            """
+        )
+    )
+    month = month_start(end - timedelta(days=days + 1))
+    while month <= end:
+        following = month_start(month, 1)
+        connection.execute(
+            text(
+                f"CREATE TABLE bench_history_y{month.year}m{month.month:02d} "
+                f"PARTITION OF bench_history_partitioned "
+                f"FOR VALUES FROM ('{month}') TO ('{following}')"
+            )
+        )
+        month = following
+    connection.execute(
+        text("INSERT INTO bench_history_partitioned SELECT * FROM bench_history_heap")
+    )
+    for table in ("bench_history_heap", "bench_history_partitioned"):
+        connection.execute(
+            text(f"CREATE INDEX ON {table} (entity_id, scraped_at DESC)")
+        )
+    connection.execute(text("ANALYZE bench_history_heap"))
+    connection.execute(text("ANALYZE bench_history_partitioned"))
+
+
+def time_query(connection, query, params, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(text(query), params).all()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark history queries before and after partitioning."
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--entities", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--latest", type=int, default=2_000, help="Videos per lookup")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    end = date.today() + timedelta(days=1)
+    ids = [f"entity_{i}" for i in range(args.latest)]
+    # (query, parameters), each run on both tables
+    queries = {
+        "latest snapshot per video (DISTINCT ON)": (LATEST_SNAPSHOTS, {"ids": ids}),
+        "latest snapshot per video (LATERAL)": (
+            LATEST_SNAPSHOTS_LATERAL,
+            {"ids": ids},
+        ),
+        "30-day series for one channel": (
+            TIME_SERIES,
+            {"entity_id": "entity_1", "since": end - timedelta(days=30)},
+        ),
+    }
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            start = time.perf_counter()
+            create_tables(connection, args.rows, args.entities, args.days, end)
+            print(
+                f"Created {args.rows} history rows for {args.entities} entities "
+                f"over {args.days} days in {time.perf_counter() - start:.1f}s."
+            )
+            for name, (query, params) in queries.items():
+                heap = time_query(
+                    connection,
+                    query.format(table="bench_history_heap"),
+                    params,
+                    args.repeat,
+                )
+                partitioned = time_query(
+                    connection,
+                    query.format(table="bench_history_partitioned"),
+                    params,
+                    args.repeat,
+                )
+                print(
+                    f"{name}: heap {heap * 1000:.1f}ms, "
+                    f"partitioned {partitioned * 1000:.1f}ms ({heap / partitioned:.1f}x)"
+                )
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Micro-benchmark of API item normalisation over popular_videos.json:
+# the previous per-key regex, in-place rewrite against the flat row normaliser.
+# Both paths end with the row bulk_ingest sends for VideoData, so the previous
+# one includes flattening its nested dicts, as the baseline ingest did.
+# Usage: python -m benchmarks.normalise [--repeat 50]
+import argparse
+import copy
+import re
+import time
+
+from src.core.api import join_tags, normalise_video
+from src.core.replay import iter_json_array
+from src.database.database import column_map, flatten_item
+from src.database.models import VideoData
+
+COLUMNS = column_map(VideoData)
+
+
+def legacy_camel_to_snake(name):
+    s1 = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", name)
+    return re.sub("([a-z0-9])([A-Z])", r"\1_\2", s1).lower()
+
+
+def legacy_normalise_video(video):
+    """
+    The previous normalisation: join tags, then pop and re-insert every nested key.
+    """
+    snippet = video.get("snippet", {})
+    if "tags" in snippet and isinstance(snippet["tags"], list):
+        snippet["tags"] = join_tags(snippet["tags"])
+    for key in video:
+        if isinstance(video[key], dict):
+            subkeys = list(video[key].keys())
+            for subkey in subkeys:
+                snake_subkey = legacy_camel_to_snake(subkey)
+                if subkey != snake_subkey:
+                    video[key][snake_subkey] = video[key].pop(subkey)
+    return video
+
+
+def legacy_video_row(video):
+    """
+    The previous path to an insertable row: normalise in place, then flatten.
+    """
+    video = legacy_normalise_video(video)
+    video["video_id"] = video.pop("id", None)
+    return flatten_item(video, COLUMNS)
+
+
+def video_row(video):
+    """
+    The current path: a flat row, aligned to the columns like every bulk row.
+    """
+    return flatten_item(normalise_video(video), COLUMNS)
+
+
+def run(normalise, batches):
+    """
+    Normalise every prepared copy of the dump and return items per second.
+    Copies are made beforehand so only normalisation is timed.
+    """
+    count = sum(len(batch) for batch in batches)
+    start = time.perf_counter()
+    for batch in batches:
+        for item in batch:
+            normalise(item)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark API item normalisation."
+    )
+    parser.add_argument("--file", default="popular_videos.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    items = list(iter_json_array(args.file))
+    print(f"Normalising {len(items)} items x {args.repeat} repeats.")
+    for name, normalise in [
+        ("regex, in place, then flattened", legacy_video_row),
+        ("precomputed, flat row", video_row),
+    ]:
+        batches = [copy.deepcopy(items) for _ in range(args.repeat)]
+        print(f"{name}: {run(normalise, batches):,.0f} items/s")
+
+
+if __name__ == "__main__":
+    main()
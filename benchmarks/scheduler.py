@@ -0,0 +1,113 @@
+# Exercise the request scheduler against a local fake YouTube HTTP server that
+# fails a share of requests with 429/503 and rate-limit 403s, and adds latency.
+# Uses the real googleapiclient, pointed at the local server.
+# Usage: python -m benchmarks.scheduler [--requests 200] [--workers 8] [--failure-rate 0.2]
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+from googleapiclient.discovery import build
+
+from src.core.replay import iter_json_array
+from src.core.scheduler import RequestScheduler
+
+RATE_LIMIT_BODY = json.dumps(
+    {"error": {"code": 403, "errors": [{"reason": "rateLimitExceeded"}]}}
+).encode()
+
+
+def fake_handler(items, failure_rate, latency):
+    """
+    Build a request handler serving videos.list pages from the given items.
+    """
+
+    class FakeYouTubeHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(random.uniform(0, 2 * latency))
+            roll = random.random()
+            if roll < failure_rate / 3:
+                self.reply(429, b"{}")
+            elif roll < 2 * failure_rate / 3:
+                self.reply(503, b"{}")
+            elif roll < failure_rate:
+                self.reply(403, RATE_LIMIT_BODY)
+            else:
+                self.reply(200, json.dumps({"items": items[:50]}).encode())
+
+        def reply(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeYouTubeHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the request scheduler against a fake YouTube server."
+    )
+    parser.add_argument("--file", default="popular_videos.json")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rate", type=float, default=50)
+    args = parser.parse_args()
+
+    items = list(iter_json_array(args.file))
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), fake_handler(items, args.failure_rate, args.latency)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = build(
+        "youtube",
+        "v3",
+        developerKey="fake",
+        client_options={"api_endpoint": f"http://127.0.0.1:{server.server_port}"},
+    )
+    # Short backoff so the run finishes quickly; the retry logic is unchanged
+    scheduler = RequestScheduler(
+        rate=args.rate,
+        burst=args.workers,
+        quota_budget=args.requests * 10,
+        max_retries=8,
+        backoff_base=0.01,
+        backoff_max=0.2,
+    )
+    local = threading.local()
+
+    def fetch(_):
+        if not hasattr(local, "http"):
+            local.http = httplib2.Http()
+        request = client.videos().list(part="snippet", chart="mostPopular")
+        return len(scheduler.execute(request, http=local.http)["items"])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(fetch, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    metrics = scheduler.metrics()
+    metrics.update(
+        completed=len(results),
+        items=sum(results),
+        elapsed=round(elapsed, 3),
+        throughput=round(len(results) / elapsed, 1),
+    )
+    print(json.dumps(metrics, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# Measure video search against a large history table:
+#   - insert throughput with search vectors built and GIN indexes maintained,
+#     as paid by the live table at ingest
+#   - latency of full-text and tag queries through the GIN indexes
+# and compare against the sequential ILIKE scan they replace.
+# Synthetic snapshots are written to video_history inside a transaction that
+# is always rolled back. Words are drawn from a skewed vocabulary, so queries
+# for common, mid-frequency and rare words match very different row counts.
+# Usage: python -m benchmarks.search [--rows 1000000] [--repeat 5]
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, or_, select, text
+
+from src.database.database import engine
+from src.database.models import VideoHistory
+from src.database.partitions import ensure_partitions
+from src.database.search import search_statement
+
+VOCABULARY = 20000
+
+# (label, full-text query, tag)
+QUERIES = [
+    ("common word", "word1", None),
+    ("mid-frequency word", "word200", None),
+    ("rare word", "word15000", None),
+    ("two words", "word3 word40", None),
+    ("phrase", '"word1 word2"', None),
+    ("tag", None, "tag7"),
+    ("word and tag", "word200", "tag7"),
+]
+
+
+def create_snapshots(connection, rows, snapshots, end):
+    """
+    Write `rows` video snapshots, `snapshots` per video, one scrape per hour,
+    with 6-word titles, 40-word descriptions and 5 tags.
+    """
+    ensure_partitions(connection, start=end - timedelta(hours=snapshots + 24))
+    connection.execute(
+        text(
+            """
+            INSERT INTO video_history (
+                video_id, scraped_at, title, description, published_at, view_count,
+                tags, tag_list, search_vector, rank, scrape_type, region,
+                channel_id, category_id
+            )
+            SELECT 'bench_' || v,
+                   CAST(:end AS timestamp) - s * interval '1 hour',
+                   words.title, words.description,
+                   CAST(:end AS timestamp) - interval '30 days',
+                   v * 1000, array_to_string(words.tags, ', '), words.tags,
+                   video_search_vector(words.title, words.tags, words.description),
+                   (v + s) % 50 + 1, 'popular', 'US', 'channel_' || (v % 5000), 10
+            FROM generate_series(1, :videos) AS v
+            -- Words are chosen per video, the zero terms stop Postgres from
+            -- evaluating the subqueries only once
+            CROSS JOIN LATERAL (
+                SELECT
+                    (SELECT string_agg('word' || floor(power(random(), 4) * :vocabulary + 1)::int, ' ')
+                     FROM generate_series(1, 6 + v * 0)) AS title,
+                    (SELECT string_agg('word' || floor(power(random(), 4) * :vocabulary + 1)::int, ' ')
+                     FROM generate_series(1, 40 + v * 0)) AS description,
+                    (SELECT array_agg('tag' || floor(power(random(), 3) * 2000 + 1)::int)
+                     FROM generate_series(1, 5 + v * 0)) AS tags
+            ) AS words
+            CROSS JOIN generate_series(1, :snapshots) AS s
+            """
+        ),
+        {
+            "videos": rows // snapshots,
+            "snapshots": snapshots,
+            "end": end,
+            "vocabulary": VOCABULARY,
+        },
+    )
+    connection.execute(text("ANALYZE video_history"))
+
+
+def count_statement(table, q, tag):
+    """
+    Count the videos a search matches.
+    """
+    conditions = []
+    if q:
+        conditions.append(
+            table.c.search_vector.op("@@")(func.websearch_to_tsquery("english", q))
+        )
+    if tag:
+        conditions.append(table.c.tag_list.contains([tag]))
+    return select(func.count(func.distinct(table.c.video_id))).where(*conditions)
+
+
+def ilike_statement(table, q, tag):
+    """
+    Previous approach for comparison: substring matches over the text columns.
+    """
+    conditions = []
+    if q:
+        pattern = f"%{q.strip(chr(34))}%"
+        conditions.append(
+            or_(
+                table.c.title.ilike(pattern),
+                table.c.description.ilike(pattern),
+                table.c.tags.ilike(pattern),
+            )
+        )
+    if tag:
+        conditions.append(table.c.tags.ilike(f"%{tag}%"))
+    return select(func.count(func.distinct(table.c.video_id))).where(*conditions)
+
+
+def timed(connection, statement, repeat):
+    """
+    Return the median seconds to run a statement and its result rows.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = connection.execute(statement).all()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark full-text and tag search over video history."
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--snapshots", type=int, default=10, help="Per video")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+    parser.add_argument(
+        "--baseline-repeat", type=int, default=1, help="Runs per ILIKE query, 0 to skip"
+    )
+    args = parser.parse_args()
+
+    table = VideoHistory.__table__
+    end = date.today() + timedelta(days=1)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            start = time.perf_counter()
+            create_snapshots(connection, args.rows, args.snapshots, end)
+            elapsed = time.perf_counter() - start
+            print(
+                f"inserted {args.rows} rows with search vector and GIN indexes: "
+                f"{args.rows / elapsed:.0f} rows/s"
+            )
+            for label, q, tag in QUERIES:
+                tags = [tag] if tag else []
+                seconds, rows = timed(
+                    connection, search_statement(table, q, tags, limit=20), args.repeat
+                )
+                matched = connection.execute(count_statement(table, q, tag)).scalar()
+                line = (
+                    f"{label:>20}: GIN {seconds * 1000:8.1f} ms "
+                    f"(first page of {matched} videos)"
+                )
+                if args.baseline_repeat:
+                    seconds, _ = timed(
+                        connection, ilike_statement(table, q, tag), args.baseline_repeat
+                    )
+                    line += f", ILIKE scan {seconds * 1000:8.1f} ms"
+                print(line)
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
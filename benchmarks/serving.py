@@ -0,0 +1,177 @@
+# Load test the API server at increasing worker counts.
+# For each count, `python main.py serve` is started against the configured
+# database, and the benchmark waits until every worker reports ready. Then
+# async httpx clients, spread over several processes so the client is not
+# the bottleneck, send a fixed mix of read requests for a fixed duration.
+# Reports throughput and latency percentiles per worker count. The database
+# needs live data, e.g. from `python main.py ingest` or a replay.
+# Usage: python -m benchmarks.serving [--workers 1 2 4 8] [--concurrency 64]
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# (path, weight): mostly the current trending set, some database-backed reads
+REQUEST_MIX = [
+    ("/live/charts/US?limit=50", 30),
+    ("/live/categories/10/videos?limit=50", 15),
+    ("/leaderboards/channels?limit=20", 15),
+    ("/leaderboards/movers?limit=20", 10),
+    ("/trends/channels?days=7", 10),
+    ("/video_data?limit=100", 10),
+    ("/search?q=music", 10),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port):
+    """
+    Start the API server with the given number of workers.
+    """
+    env = {**os.environ, "API_WORKERS": str(workers), "API_PORT": str(port)}
+    env.setdefault("LOG_LEVEL", "WARNING")
+    return subprocess.Popen(
+        [sys.executable, "main.py", "serve"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+    )
+
+
+def wait_ready(base_url, workers, timeout=120):
+    """
+    Poll the readiness endpoint until every worker has answered ready.
+    Connections are not reused, so polls spread over the workers.
+    """
+    ready = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"{base_url}/health/ready", timeout=5)
+            if response.status_code == 200:
+                ready.add(response.json()["pid"])
+                if len(ready) >= workers:
+                    return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{len(ready)} of {workers} workers ready after {timeout}s")
+
+
+async def drive(base_url, concurrency, duration, seed):
+    """
+    Send requests from `concurrency` tasks for `duration` seconds.
+    Returns the latency of each successful request and the error count.
+    """
+    paths = [path for path, _ in REQUEST_MIX]
+    weights = [weight for _, weight in REQUEST_MIX]
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                path = rng.choices(paths, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def load_test(base_url, concurrency, duration, clients):
+    """
+    Run the request mix from `clients` processes sharing the concurrency.
+    """
+    per_client = max(concurrency // clients, 1)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(
+            client_process,
+            [(base_url, per_client, duration, seed) for seed in range(clients)],
+        )
+    latencies = sorted(
+        latency for client_latencies, _ in results for latency in client_latencies
+    )
+    errors = sum(client_errors for _, client_errors in results)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure API throughput and latency at several worker counts."
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per run")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds before measuring")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes")
+    parser.add_argument("--output", help="Also write the results as JSON here")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(workers, port)
+        try:
+            wait_ready(base_url, workers)
+            # Fill each worker's response cache and pool before measuring
+            load_test(base_url, args.concurrency, args.warmup, args.clients)
+            result = load_test(base_url, args.concurrency, args.duration, args.clients)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        results.append({"workers": workers, **result})
+        print(
+            f"{workers} workers: {result['throughput']:8.1f} req/s, "
+            f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+            f"{result['errors']} errors"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# Compare reads of the latest scrape served from the in-memory snapshot with
+# the same reads as ORM queries against Postgres:
+#   - memory allocated by loading the snapshot vs loading the ORM rows
+#   - latency of a chart, a category and a channel read, serialised to JSON
+# Synthetic live tables are filled inside a transaction that is always rolled
+# back; descriptions are a few kilobytes, like real ones.
+# Usage: python -m benchmarks.snapshot [--regions 5] [--repeat 200]
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from src.api.schemas import LiveChannel, LiveVideos
+from src.api.snapshot import load_snapshot
+from src.database.database import engine
+from src.database.models import Channels, VideoData, VideoType
+
+CATEGORIES = [1, 2, 10, 15, 17, 19, 20, 22, 23, 24, 25, 26, 27, 28]
+CHART_SIZE = 50
+
+
+def create_live_data(connection, regions, channels):
+    """
+    Fill the live tables with one popular and one chart per category for each
+    region, and drawn from a pool of `channels` channels.
+    """
+    connection.execute(delete(VideoData))
+    connection.execute(delete(Channels))
+    connection.execute(
+        text(
+            """
+            INSERT INTO channels (channel_id, title, description, published_at,
+                                  view_count, subscriber_count, video_count,
+                                  popular_count, average_views)
+            SELECT 'bench_channel_' || c, 'Channel ' || c, repeat('about ', 200),
+                   now() - interval '5 years', c * 100000, c * 1000, 100, 1, c * 5000
+            FROM generate_series(1, :channels) AS c
+            """
+        ),
+        {"channels": channels},
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO categories (category_id, name, assignable)
+            SELECT category_id, 'Category ' || category_id, true
+            FROM unnest(CAST(:categories AS int[])) AS category_id
+            ON CONFLICT DO NOTHING
+            """
+        ),
+        {"categories": CATEGORIES},
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO video_data (video_id, title, description, published_at,
+                                    view_count, like_count, comment_count, tags,
+                                    scrape_type, scrape_category, rank, region,
+                                    channel_id, category_id)
+            SELECT 'bench_' || (hashtext(region || chart || rank) & 4095),
+                   'Video title ' || rank, repeat('description ', 250),
+                   now() - interval '2 days', (51 - rank) * 100000, rank * 100,
+                   rank * 10, 'tag one, tag two, tag three',
+                   CAST(CASE WHEN chart = 0 THEN 'popular' ELSE 'category' END AS videotype),
+                   NULLIF(chart, 0), rank, region,
+                   'bench_channel_' || (1 + (hashtext(region || chart || rank) & 4095) % :channels),
+                   CASE WHEN chart = 0
+                        THEN (CAST(:categories AS int[]))[1 + rank % :category_count]
+                        ELSE chart END
+            FROM unnest(CAST(:regions AS text[])) AS region
+            CROSS JOIN unnest(array_prepend(0, CAST(:categories AS int[]))) AS chart
+            CROSS JOIN generate_series(1, :chart_size) AS rank
+            ON CONFLICT DO NOTHING
+            """
+        ),
+        {
+            "regions": regions,
+            "categories": CATEGORIES,
+            "category_count": len(CATEGORIES),
+            "chart_size": CHART_SIZE,
+            "channels": channels,
+        },
+    )
+
+
+def allocated(load):
+    """
+    Return the result of load() and the bytes it left allocated.
+    """
+    tracemalloc.start()
+    try:
+        result = load()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current
+
+
+def timed(read, keys, repeat):
+    """
+    Return the median microseconds of read() over randomly chosen keys.
+    """
+    timings = []
+    for _ in range(repeat):
+        key = random.choice(keys)
+        start = time.perf_counter()
+        read(key)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark in-memory snapshot reads against database reads."
+    )
+    parser.add_argument("--regions", type=int, default=5, help="Regions scraped")
+    parser.add_argument("--channels", type=int, default=1500)
+    parser.add_argument("--repeat", type=int, default=200, help="Reads per case")
+    args = parser.parse_args()
+
+    regions = ["US", "GB", "DE", "FR", "JP", "IN", "BR", "CA", "KR", "MX"][: args.regions]
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            create_live_data(connection, regions, args.channels)
+            session = Session(bind=connection)
+
+            snapshot, snapshot_bytes = allocated(lambda: load_snapshot(session, 0))
+            _, orm_bytes = allocated(
+                lambda: (
+                    session.scalars(select(VideoData)).all(),
+                    session.scalars(select(Channels)).all(),
+                )
+            )
+            session.expunge_all()
+            print(
+                f"{snapshot.video_count} videos, {len(snapshot.channels)} channels: "
+                f"snapshot {snapshot.memory_bytes / 2**20:.1f} MiB by deep size, "
+                f"{snapshot_bytes / 2**20:.1f} MiB allocated, loaded in "
+                f"{snapshot.load_seconds * 1000:.0f} ms; ORM rows "
+                f"{orm_bytes / 2**20:.1f} MiB allocated"
+            )
+
+            charts = [
+                (region, scrape_category)
+                for region in regions
+                for scrape_category in [None] + CATEGORIES
+            ]
+            channel_ids = list(snapshot.channels)
+
+            def chart_query(key):
+                region, scrape_category = key
+                scrape_type = (
+                    VideoType.popular if scrape_category is None else VideoType.category
+                )
+                videos = session.scalars(
+                    select(VideoData)
+                    .where(
+                        VideoData.region == region,
+                        VideoData.scrape_type == scrape_type,
+                        VideoData.scrape_category.is_not_distinct_from(scrape_category),
+                    )
+                    .order_by(VideoData.rank)
+                )
+                videos = videos.all()
+                LiveVideos(generation=0, total=len(videos), items=videos).model_dump_json()
+                session.expunge_all()
+
+            def chart_memory(key):
+                region, scrape_category = key
+                scrape_type = (
+                    VideoType.popular if scrape_category is None else VideoType.category
+                )
+                videos = snapshot.chart(region, scrape_type, scrape_category)
+                LiveVideos(generation=0, total=len(videos), items=videos).model_dump_json()
+
+            def category_query(category_id):
+                videos = session.scalars(
+                    select(VideoData)
+                    .distinct(VideoData.view_count, VideoData.video_id)
+                    .where(VideoData.category_id == category_id)
+                    .order_by(VideoData.view_count.desc(), VideoData.video_id)
+                    .limit(50)
+                ).all()
+                LiveVideos(generation=0, total=len(videos), items=videos).model_dump_json()
+                session.expunge_all()
+
+            def category_memory(category_id):
+                videos = snapshot.category(category_id)
+                LiveVideos(
+                    generation=0, total=len(videos), items=videos[:50]
+                ).model_dump_json()
+
+            def channel_query(channel_id):
+                channel = session.get(Channels, channel_id)
+                videos = session.scalars(
+                    select(VideoData)
+                    .where(VideoData.channel_id == channel_id)
+                    .order_by(VideoData.view_count.desc())
+                ).all()
+                LiveChannel(generation=0, channel=channel, videos=videos).model_dump_json()
+                session.expunge_all()
+
+            def channel_memory(channel_id):
+                channel, videos = snapshot.channel(channel_id)
+                LiveChannel(generation=0, channel=channel, videos=videos).model_dump_json()
+
+            for label, query, memory, keys in (
+                ("chart", chart_query, chart_memory, charts),
+                ("category", category_query, category_memory, CATEGORIES),
+                ("channel", channel_query, channel_memory, channel_ids),
+            ):
+                database = timed(query, keys, args.repeat)
+                in_memory = timed(memory, keys, args.repeat)
+                print(
+                    f"{label:>8}: database {database:8.0f} us, "
+                    f"snapshot {in_memory:8.0f} us ({database / in_memory:.0f}x)"
+                )
+            session.close()
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,25 @@
 import sys
+from datetime import date
 
+from src.api.server import run_server
+from src.core.analytics import analyse_history
+from src.core.archive import export_history
+from src.core.daemon import run_daemon
 from src.core.ingest_data import ingest_data
+from src.core.logs import configure_logging
+from src.database.database import SessionLocal, engine
 from src.database.init_db import init_db, reset_db
+from src.database.models import ChannelHistory, VideoHistory
+from src.database.partitions import (
+    detach_partitions,
+    ensure_partitions,
+    partition_history,
+)
+from src.database.rollups import refresh_rollups
 
 
 def main():
+    configure_logging()
     if len(sys.argv) > 1:
         command = sys.argv[1]
         if command == "reset":
@@ -13,10 +28,59 @@ def main():
             init_db()
         elif command == "ingest":
             ingest_data()
+        elif command == "daemon":
+            run_daemon()
+        elif command == "serve":
+            run_server()
+        elif command == "replay" and len(sys.argv) > 2:
+            ingest_data(replay_path=sys.argv[2])
+        elif command == "record" and len(sys.argv) > 2:
+            ingest_data(record_dir=sys.argv[2])
+        elif command == "partitions":
+            with engine.begin() as connection:
+                partition_history(connection)
+                ensure_partitions(connection)
+        elif command == "detach" and len(sys.argv) > 2:
+            with engine.begin() as connection:
+                detach_partitions(
+                    connection,
+                    date.fromisoformat(sys.argv[2]),
+                    drop="--drop" in sys.argv,
+                )
+        elif command == "rollups":
+            session = SessionLocal()
+            try:
+                refresh_rollups(session, full=True)
+                session.commit()
+            finally:
+                session.close()
+        elif command == "analytics":
+            with engine.begin() as connection:
+                analyse_history(connection, VideoHistory)
+                analyse_history(connection, ChannelHistory)
+        elif command == "export" and len(sys.argv) > 2:
+            before = None
+            if "--before" in sys.argv:
+                position = sys.argv.index("--before") + 1
+                try:
+                    before = date.fromisoformat(sys.argv[position])
+                except (IndexError, ValueError):
+                    print("Usage: export <dir> [--before <YYYY-MM-DD> [--archive]]")
+                    return
+            archive = "--archive" in sys.argv
+            if archive and before is None:
+                print("--archive needs --before <YYYY-MM-DD>.")
+                return
+            with engine.begin() as connection:
+                export_history(connection, sys.argv[2], before=before, archive=archive)
         else:
-            print("Invalid command. Use 'reset', 'init', or 'ingest'.")
+            print(
+                "Invalid command. Use 'reset', 'init', 'ingest', 'daemon', 'serve', 'replay <dir|file>', 'record <dir>', 'partitions', 'detach <YYYY-MM-DD> [--drop]', 'rollups', 'analytics' or 'export <dir> [--before <YYYY-MM-DD> [--archive]]'."
+            )
     else:
-        print("No command provided. Use 'reset', 'init', or 'ingest'.")
+        print(
+            "No command provided. Use 'reset', 'init', 'ingest', 'daemon', 'serve', 'replay <dir|file>', 'record <dir>', 'partitions', 'detach <YYYY-MM-DD> [--drop]', 'rollups', 'analytics' or 'export <dir> [--before <YYYY-MM-DD> [--archive]]'."
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+# Response cache for the read endpoints.
+# Entries are keyed on the ingest generation, so an ingest commit makes every
+# previous entry unreachable without any explicit invalidation.
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Response
+
+from src import (
+    cache_max_entries,
+    cache_redis_url,
+    cache_ttl,
+    generation_check_interval,
+)
+from src.database.database import current_generation
+
+# One entity tag of an If-None-Match list, weak or strong
+ENTITY_TAG = re.compile(r'(?:W/)?("[^"]*")')
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Return whether an If-None-Match header matches the ETag: "*", or any tag
+    of its comma-separated list under weak comparison (RFC 9110), so a W/
+    prefix added by a proxy still matches.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = ENTITY_TAG.fullmatch(etag).group(1)
+    return opaque in ENTITY_TAG.findall(if_none_match)
+
+
+class MemoryBackend:
+    """
+    In-process LRU cache with per-entry TTL.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries=cache_max_entries, ttl=cache_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Cache stored in Redis, or anything exposing Redis' get/set(ex=) interface.
+    Shared by every API worker; eviction is left to the TTL and Redis' own policy.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, ttl=cache_ttl, prefix="api:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        etag, body = value.split(b"\n", 1)
+        return etag.decode(), body
+
+    def set(self, key, value):
+        etag, body = value
+        self.client.set(self.prefix + key, etag.encode() + b"\n" + body, ex=self.ttl)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+def default_backend():
+    """
+    Use Redis when CACHE_REDIS_URL is set, otherwise the in-process cache.
+    """
+    if cache_redis_url:
+        import redis  # Only needed for the shared backend
+
+        return RedisBackend(redis.Redis.from_url(cache_redis_url))
+    return MemoryBackend()
+
+
+class ResponseCache:
+    """
+    Cache serialised JSON responses per ingest generation and answer
+    If-None-Match requests with 304s.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else default_backend()
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._generation = None
+        self._generation_checked = 0.0
+
+    def generation(self, session):
+        """
+        Return the ingest generation, re-reading it at most every few seconds.
+        """
+        now = time.monotonic()
+        if (
+            self._generation is None
+            or now - self._generation_checked > generation_check_interval
+        ):
+            self._generation = current_generation(session)
+            self._generation_checked = now
+        return self._generation
+
+    def respond(self, request, session, build):
+        """
+        Return the cached response for this request, calling build() on a miss.
+        build() returns a Pydantic model to serialise.
+        """
+        generation = self.generation(session)
+        key = f"{generation}:{request.url.path}?{sorted(request.query_params.multi_items())}"
+
+        cached = self.backend.get(key)
+        if cached is None:
+            with self._stats_lock:
+                self.misses += 1
+            body = build().model_dump_json().encode()
+            etag = f'"{generation}-{hashlib.sha1(body).hexdigest()[:16]}"'
+            cached = (etag, body)
+            self.backend.set(key, cached)
+        else:
+            with self._stats_lock:
+                self.hits += 1
+
+        etag, body = cached
+        headers = {"ETag": etag, "X-Ingest-Generation": str(generation)}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            "hits": hits,
+            "misses": misses,
+            "generation": self._generation,
+        }
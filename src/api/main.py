@@ -1,11 +1,150 @@
-from fastapi import FastAPI
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from enum import Enum
 
-from src.database.database import SessionLocal
-from src.database.models import ChannelHistory, Channels, VideoData, VideoHistory
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, select
 
-session = SessionLocal()
+from src import leaderboard_size
+from src.api.cache import ResponseCache
+from src.api.schemas import (
+    CategoryTrends,
+    CategoryVideoLeaderboard,
+    ChannelLeaderboard,
+    ChannelTrends,
+    LiveChannel,
+    LiveVideos,
+    RankMovers,
+    SearchPage,
+    VideoDataOut,
+    VideoDataPage,
+    VideoTrend,
+)
+from src.api.snapshot import SnapshotStore
+from src.core.logs import configure_logging
+from src.database.database import ApiSessionLocal, api_engine
+from src.database.engine import pool_metrics
+from src.database.leaderboards import ChannelRankMetric, VideoRankMetric
+from src.database.models import (
+    CategoryDaily,
+    CategoryVideoRank,
+    ChannelDaily,
+    ChannelRank,
+    Channels,
+    ChartPosition,
+    VideoDaily,
+    VideoData,
+    VideoHistory,
+    VideoType,
+)
+from src.database.search import search_statement
 
-app = FastAPI()
+response_cache = ResponseCache()
+
+# Latest scrape kept in memory, see snapshot.py
+snapshot_store = SnapshotStore()
+
+started_at = time.time()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Set up a worker process: its own connection pool, and a thread loading
+    each new snapshot in the background so requests never wait for it.
+    """
+    configure_logging()
+    # Connections inherited from a parent process belong to the parent
+    api_engine.dispose(close=False)
+    stopping = threading.Event()
+    refresher = threading.Thread(
+        target=snapshot_store.run_refresh,
+        args=(stopping,),
+        name="snapshot-refresh",
+        daemon=True,
+    )
+    refresher.start()
+    try:
+        yield
+    finally:
+        stopping.set()
+        refresher.join(timeout=5)
+        api_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def get_session():
+    """
+    Provide a session per request. Routes using it are plain `def` functions,
+    so FastAPI runs them in its threadpool instead of blocking the event loop.
+    """
+    session = ApiSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def video_filters(
+    scrape_type: VideoType | None = None,
+    scrape_category: int | None = None,
+    channel_id: str | None = None,
+    region: str | None = None,
+):
+    """
+    Build the WHERE clauses shared by the video endpoints.
+    """
+    filters = []
+    if region is not None:
+        filters.append(VideoData.region == region.upper())
+    if scrape_type is not None:
+        filters.append(VideoData.scrape_type == scrape_type)
+    if scrape_category is not None:
+        filters.append(VideoData.scrape_category == scrape_category)
+    if channel_id is not None:
+        filters.append(VideoData.channel_id == channel_id)
+    return filters
+
+
+class ChannelTrendMetric(str, Enum):
+    view_count_delta = "view_count_delta"
+    subscriber_count_delta = "subscriber_count_delta"
+    popular_view_count_delta = "popular_view_count_delta"
+    like_count_delta = "like_count_delta"
+    comment_count_delta = "comment_count_delta"
+
+
+class MoverDirection(str, Enum):
+    up = "up"
+    down = "down"
+
+
+class SearchScope(str, Enum):
+    live = "live"
+    history = "history"
+
+
+SEARCH_TABLES = {
+    SearchScope.live: VideoData.__table__,
+    SearchScope.history: VideoHistory.__table__,
+}
+
+
+def rollup_window(session, table_class, days):
+    """
+    Return the first and last day of a window of `days` days ending at the
+    latest rolled-up day, or (None, None) before the first rollup.
+    """
+    end = session.scalar(select(func.max(table_class.day)))
+    if end is None:
+        return None, None
+    return end - timedelta(days=days - 1), end
 
 
 @app.get("/")
@@ -13,6 +152,366 @@ async def root():
     return {"message": "Hello World"}
 
 
-@app.get("/video_data")
-async def getVideoData() -> list[VideoData]:
-    return session.query(VideoData).all()
+@app.get("/health/live")
+async def getLiveness():
+    """
+    Answer as long as the worker's event loop is running.
+    """
+    return {"status": "alive", "pid": os.getpid(), "uptime": time.time() - started_at}
+
+
+@app.get("/health/ready")
+def getReadiness(session=Depends(get_session)):
+    """
+    Report whether this worker can serve traffic: the database answers and
+    the first snapshot has loaded.
+    """
+    checks = {"snapshot": snapshot_store.ready()}
+    try:
+        session.execute(select(1))
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+    ready = all(checks.values())
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "unavailable",
+            "pid": os.getpid(),
+            "generation": snapshot_store.stats()["generation"],
+            "checks": checks,
+        },
+        status_code=200 if ready else 503,
+    )
+
+
+@app.get("/cache/stats")
+def getCacheStats():
+    return response_cache.stats()
+
+
+@app.get("/live/stats")
+def getSnapshotStats():
+    """
+    Describe the in-memory snapshot, including its size in bytes.
+    """
+    snapshot_store.current()
+    return snapshot_store.stats()
+
+
+@app.get("/db/pool")
+def getPoolMetrics():
+    return pool_metrics(api_engine)
+
+
+@app.get("/video_data", response_model=VideoDataPage)
+def getVideoData(
+    request: Request,
+    after: int | None = Query(None, description="pk_id cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    filters: list = Depends(video_filters),
+    session=Depends(get_session),
+):
+    """
+    Page through video data in pk_id order using keyset pagination.
+    """
+
+    def build():
+        query = select(VideoData).where(*filters).order_by(VideoData.pk_id).limit(limit)
+        if after is not None:
+            query = query.where(VideoData.pk_id > after)
+        videos = session.scalars(query).all()
+        next_cursor = videos[-1].pk_id if len(videos) == limit else None
+        return VideoDataPage(items=videos, next_cursor=next_cursor)
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/video_data/export")
+def exportVideoData(filters: list = Depends(video_filters)):
+    """
+    Stream all matching video data as newline-delimited JSON.
+    """
+
+    def rows():
+        # The response outlives the request scope, so the stream owns its session
+        session = ApiSessionLocal()
+        try:
+            query = (
+                select(VideoData)
+                .where(*filters)
+                .order_by(VideoData.pk_id)
+                .execution_options(yield_per=1000)
+            )
+            for video in session.scalars(query):
+                yield VideoDataOut.model_validate(video).model_dump_json() + "\n"
+        finally:
+            session.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+@app.get("/trends/channels", response_model=ChannelTrends)
+def getChannelTrends(
+    request: Request,
+    days: int = Query(7, ge=1, le=366),
+    metric: ChannelTrendMetric = ChannelTrendMetric.view_count_delta,
+    limit: int = Query(20, ge=1, le=500),
+    session=Depends(get_session),
+):
+    """
+    Rank channels by their summed daily growth over the latest `days` days.
+    """
+
+    def build():
+        start, end = rollup_window(session, ChannelDaily, days)
+        if start is None:
+            return ChannelTrends(items=[])
+        totals = (
+            select(
+                ChannelDaily.channel_id,
+                func.sum(ChannelDaily.view_count_delta).label("view_count_delta"),
+                func.sum(ChannelDaily.subscriber_count_delta).label(
+                    "subscriber_count_delta"
+                ),
+                func.sum(ChannelDaily.popular_view_count_delta).label(
+                    "popular_view_count_delta"
+                ),
+                func.sum(ChannelDaily.like_count_delta).label("like_count_delta"),
+                func.sum(ChannelDaily.comment_count_delta).label("comment_count_delta"),
+            )
+            .where(ChannelDaily.day.between(start, end))
+            .group_by(ChannelDaily.channel_id)
+            .subquery()
+        )
+        query = (
+            select(totals, Channels.title)
+            .outerjoin(Channels, Channels.channel_id == totals.c.channel_id)
+            .order_by(totals.c[metric.value].desc().nulls_last(), totals.c.channel_id)
+            .limit(limit)
+        )
+        return ChannelTrends(
+            start=start, end=end, items=session.execute(query).mappings().all()
+        )
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/trends/categories", response_model=CategoryTrends)
+def getCategoryTrends(
+    request: Request,
+    days: int = Query(30, ge=1, le=366),
+    category_id: int | None = None,
+    session=Depends(get_session),
+):
+    """
+    Return the daily series per category over the latest `days` days.
+    """
+
+    def build():
+        start, end = rollup_window(session, CategoryDaily, days)
+        if start is None:
+            return CategoryTrends(items=[])
+        query = (
+            select(CategoryDaily)
+            .where(CategoryDaily.day.between(start, end))
+            .order_by(CategoryDaily.category_id, CategoryDaily.day)
+        )
+        if category_id is not None:
+            query = query.where(CategoryDaily.category_id == category_id)
+        return CategoryTrends(items=session.scalars(query).all())
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/trends/videos/{video_id}", response_model=VideoTrend)
+def getVideoTrend(
+    request: Request,
+    video_id: str,
+    days: int = Query(30, ge=1, le=366),
+    session=Depends(get_session),
+):
+    """
+    Return the daily series of one video over the latest `days` days.
+    """
+
+    def build():
+        query = (
+            select(VideoDaily)
+            .where(VideoDaily.video_id == video_id)
+            .order_by(VideoDaily.day.desc())
+            .limit(days)
+        )
+        return VideoTrend(
+            video_id=video_id, days=list(reversed(session.scalars(query).all()))
+        )
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/search", response_model=SearchPage)
+def searchVideos(
+    request: Request,
+    q: str | None = Query(None, description="Web search syntax: words, \"phrases\", -not, or"),
+    tag: list[str] = Query([], description="Only videos with all of these tags"),
+    scope: SearchScope = SearchScope.live,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    session=Depends(get_session),
+):
+    """
+    Full-text search over video titles, tags and descriptions, best matches
+    first. Each video appears once, as its latest matching snapshot.
+    """
+    if not q and not tag:
+        raise HTTPException(status_code=400, detail="Pass a query q or a tag.")
+
+    def build():
+        # One extra row tells whether there is a next page
+        rows = (
+            session.execute(
+                search_statement(SEARCH_TABLES[scope], q, tag, limit + 1, offset)
+            )
+            .mappings()
+            .all()
+        )
+        next_offset = offset + limit if len(rows) > limit else None
+        return SearchPage(items=rows[:limit], next_offset=next_offset)
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/leaderboards/channels", response_model=ChannelLeaderboard)
+def getChannelLeaderboard(
+    request: Request,
+    metric: ChannelRankMetric = ChannelRankMetric.popular_count,
+    limit: int = Query(20, ge=1, le=leaderboard_size),
+    session=Depends(get_session),
+):
+    """
+    Return the top channels by a metric as of the latest ingest.
+    """
+
+    def build():
+        query = (
+            select(ChannelRank)
+            .where(ChannelRank.metric == metric.value)
+            .order_by(ChannelRank.position)
+            .limit(limit)
+        )
+        return ChannelLeaderboard(
+            metric=metric.value, items=session.scalars(query).all()
+        )
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get(
+    "/leaderboards/categories/{category_id}/videos",
+    response_model=CategoryVideoLeaderboard,
+)
+def getCategoryVideoLeaderboard(
+    request: Request,
+    category_id: int,
+    metric: VideoRankMetric = VideoRankMetric.view_count,
+    limit: int = Query(20, ge=1, le=leaderboard_size),
+    session=Depends(get_session),
+):
+    """
+    Return the top videos of a category by a metric as of the latest ingest.
+    """
+
+    def build():
+        query = (
+            select(CategoryVideoRank)
+            .where(
+                CategoryVideoRank.category_id == category_id,
+                CategoryVideoRank.metric == metric.value,
+            )
+            .order_by(CategoryVideoRank.position)
+            .limit(limit)
+        )
+        return CategoryVideoLeaderboard(
+            category_id=category_id,
+            metric=metric.value,
+            items=session.scalars(query).all(),
+        )
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/leaderboards/movers", response_model=RankMovers)
+def getRankMovers(
+    request: Request,
+    direction: MoverDirection = MoverDirection.up,
+    region: str | None = None,
+    limit: int = Query(20, ge=1, le=leaderboard_size),
+    session=Depends(get_session),
+):
+    """
+    Return the videos that climbed (or fell) the most places in their chart
+    between the last two ingests.
+    """
+
+    def build():
+        # Both orders walk the rank_change index, forwards or backwards
+        if direction == MoverDirection.up:
+            query = select(ChartPosition).where(ChartPosition.rank_change > 0)
+            order = (ChartPosition.rank_change.desc(), ChartPosition.id.desc())
+        else:
+            query = select(ChartPosition).where(ChartPosition.rank_change < 0)
+            order = (ChartPosition.rank_change, ChartPosition.id)
+        if region is not None:
+            query = query.where(ChartPosition.region == region.upper())
+        query = query.order_by(*order).limit(limit)
+        return RankMovers(items=session.scalars(query).all())
+
+    return response_cache.respond(request, session, build)
+
+
+@app.get("/live/charts/{region}", response_model=LiveVideos)
+def getLiveChart(
+    region: str,
+    scrape_category: int | None = Query(
+        None, description="Category chart to read, the popular chart if omitted"
+    ),
+    limit: int = Query(50, ge=1, le=200),
+):
+    """
+    Return a chart of the latest scrape in rank order, from memory.
+    """
+    snapshot = snapshot_store.current()
+    scrape_type = VideoType.popular if scrape_category is None else VideoType.category
+    videos = snapshot.chart(region.upper(), scrape_type, scrape_category)
+    return LiveVideos(
+        generation=snapshot.generation, total=len(videos), items=videos[:limit]
+    )
+
+
+@app.get("/live/categories/{category_id}/videos", response_model=LiveVideos)
+def getLiveCategoryVideos(
+    category_id: int,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Return the trending videos of a category, most viewed first, from memory.
+    """
+    snapshot = snapshot_store.current()
+    videos = snapshot.category(category_id)
+    return LiveVideos(
+        generation=snapshot.generation,
+        total=len(videos),
+        items=videos[offset : offset + limit],
+    )
+
+
+@app.get("/live/channels/{channel_id}", response_model=LiveChannel)
+def getLiveChannel(channel_id: str):
+    """
+    Return a channel and its trending videos, from memory.
+    """
+    snapshot = snapshot_store.current()
+    channel, videos = snapshot.channel(channel_id)
+    if channel is None:
+        raise HTTPException(status_code=404, detail="Channel not in the latest scrape.")
+    return LiveChannel(generation=snapshot.generation, channel=channel, videos=videos)
@@ -0,0 +1,204 @@
+# This file defines the Pydantic response models for the API.
+
+from datetime import date, datetime, timedelta
+
+from pydantic import BaseModel, ConfigDict
+
+from src.database.models import VideoType
+
+
+class VideoDataOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    pk_id: int
+    video_id: str
+    title: str
+    scraped_at: datetime
+    description: str | None = None
+    published_at: datetime
+    view_count: int | None = None
+    like_count: int | None = None
+    comment_count: int | None = None
+    duration: timedelta | None = None
+    tags: str | None = None
+    tag_list: list[str] | None = None
+    scrape_type: VideoType
+    scrape_category: int | None = None
+    rank: int
+    region: str
+    channel_id: str | None = None
+    category_id: int | None = None
+
+
+class VideoDataPage(BaseModel):
+    items: list[VideoDataOut]
+    next_cursor: int | None = None  # pk_id to pass as `after` for the next page
+
+
+class VideoDailyOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    day: date
+    view_count: int | None = None
+    like_count: int | None = None
+    comment_count: int | None = None
+    view_count_delta: int | None = None
+    like_count_delta: int | None = None
+    comment_count_delta: int | None = None
+    best_rank: int | None = None
+    snapshots: int
+
+
+class VideoTrend(BaseModel):
+    video_id: str
+    days: list[VideoDailyOut]
+
+
+class ChannelTrendOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    channel_id: str
+    title: str | None = None
+    view_count_delta: int | None = None
+    subscriber_count_delta: int | None = None
+    popular_view_count_delta: int | None = None
+    like_count_delta: int | None = None
+    comment_count_delta: int | None = None
+
+
+class ChannelTrends(BaseModel):
+    start: date | None = None  # First day of the window, None without rollups
+    end: date | None = None
+    items: list[ChannelTrendOut]
+
+
+class CategoryDailyOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    category_id: int
+    day: date
+    video_count: int
+    view_count: int | None = None
+    like_count: int | None = None
+    comment_count: int | None = None
+    view_count_delta: int | None = None
+    like_count_delta: int | None = None
+    comment_count_delta: int | None = None
+
+
+class CategoryTrends(BaseModel):
+    items: list[CategoryDailyOut]
+
+
+class SearchResultOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    video_id: str
+    title: str
+    headline: str | None = None  # Description excerpt with matches in <b></b>
+    tag_list: list[str] | None = None
+    channel_id: str | None = None
+    category_id: int | None = None
+    view_count: int | None = None
+    scraped_at: datetime
+    score: float
+
+
+class SearchPage(BaseModel):
+    items: list[SearchResultOut]
+    next_offset: int | None = None  # Offset to pass for the next page
+
+
+class ChannelRankOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    position: int
+    channel_id: str
+    title: str | None = None
+    value: int | None = None
+
+
+class ChannelLeaderboard(BaseModel):
+    metric: str
+    items: list[ChannelRankOut]
+
+
+class CategoryVideoRankOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    position: int
+    video_id: str
+    title: str | None = None
+    channel_id: str | None = None
+    value: int | None = None
+
+
+class CategoryVideoLeaderboard(BaseModel):
+    category_id: int
+    metric: str
+    items: list[CategoryVideoRankOut]
+
+
+class RankMoverOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    region: str
+    scrape_type: VideoType
+    scrape_category: int | None = None
+    video_id: str
+    title: str | None = None
+    channel_id: str | None = None
+    rank: int
+    previous_rank: int
+    rank_change: int  # Places climbed since the previous ingest
+
+
+class RankMovers(BaseModel):
+    items: list[RankMoverOut]
+
+
+class LiveVideoOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    video_id: str
+    title: str
+    published_at: datetime
+    scraped_at: datetime
+    view_count: int | None = None
+    like_count: int | None = None
+    comment_count: int | None = None
+    duration: timedelta | None = None
+    scrape_type: VideoType
+    scrape_category: int | None = None
+    rank: int
+    region: str
+    channel_id: str | None = None
+    category_id: int | None = None
+
+
+class LiveVideos(BaseModel):
+    generation: int  # Ingest generation the snapshot was loaded at
+    total: int  # Videos in the chart or group, before the limit
+    items: list[LiveVideoOut]
+
+
+class LiveChannelOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    channel_id: str
+    title: str
+    published_at: datetime
+    view_count: int | None = None
+    subscriber_count: int | None = None
+    video_count: int | None = None
+    popular_count: int | None = None
+    popular_view_count: int | None = None
+    average_views: int | None = None
+    like_count: int | None = None
+    comment_count: int | None = None
+
+
+class LiveChannel(BaseModel):
+    generation: int
+    channel: LiveChannelOut
+    videos: list[LiveVideoOut]  # Trending videos of the channel, most viewed first
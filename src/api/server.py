@@ -0,0 +1,28 @@
+# Production API server.
+# uvicorn runs the app in API_WORKERS processes behind one listening socket.
+# Each worker is started as a fresh interpreter that imports the app itself,
+# so its engine and pool, response cache and snapshot are its own, and the
+# supervisor replaces workers that die. Workers pick up a new ingest by
+# reloading their snapshot in the background, without restarting.
+
+import uvicorn
+
+from src import api_graceful_timeout, api_host, api_port, api_workers
+
+
+def run_server(workers=api_workers, host=api_host, port=api_port):
+    """
+    Serve the API until SIGINT or SIGTERM, giving in-flight requests up to
+    API_GRACEFUL_TIMEOUT seconds to finish. SIGHUP replaces the workers one
+    at a time, so with several workers the server keeps answering.
+    """
+    uvicorn.run(
+        "src.api.main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=api_graceful_timeout,
+        # Workers log through configure_logging, access lines would dominate
+        log_config=None,
+        access_log=False,
+    )
@@ -0,0 +1,285 @@
+# In-memory snapshot of the live tables for the read endpoints.
+# The latest scrape is only a few thousand videos and their channels, so every
+# API worker keeps a compact copy and answers reads about it without a query:
+# rows are __slots__ objects without descriptions, repeated strings are
+# interned, and rows are grouped by chart (in rank order), category and channel
+# when the snapshot loads. A new snapshot is loaded when the ingest generation
+# changes and swapped in with a single assignment, so a request always reads
+# one complete snapshot.
+
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from src import generation_check_interval
+from src.database.database import ApiSessionLocal, current_generation
+from src.database.models import Channels, VideoData
+
+logger = logging.getLogger(__name__)
+
+
+class VideoRow:
+    """
+    One chart entry of the live video table, without its description or tags.
+    """
+
+    __slots__ = (
+        "video_id",
+        "title",
+        "published_at",
+        "scraped_at",
+        "view_count",
+        "like_count",
+        "comment_count",
+        "duration",
+        "scrape_type",
+        "scrape_category",
+        "rank",
+        "region",
+        "channel_id",
+        "category_id",
+    )
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            value = row[name]
+            setattr(self, name, sys.intern(value) if type(value) is str else value)
+
+
+class ChannelRow:
+    """
+    One channel of the live channel table, without its description.
+    """
+
+    __slots__ = (
+        "channel_id",
+        "title",
+        "published_at",
+        "view_count",
+        "subscriber_count",
+        "video_count",
+        "popular_count",
+        "popular_view_count",
+        "average_views",
+        "like_count",
+        "comment_count",
+    )
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            value = row[name]
+            setattr(self, name, sys.intern(value) if type(value) is str else value)
+
+
+def by_views(videos):
+    """
+    Return the distinct videos of a group, most viewed first. A video in
+    several charts has the same counts in each, so its first entry is kept.
+    """
+    unique = {}
+    for video in videos:
+        unique.setdefault(video.video_id, video)
+    return tuple(
+        sorted(unique.values(), key=lambda video: (-(video.view_count or 0), video.video_id))
+    )
+
+
+def deep_size(roots):
+    """
+    Return the bytes taken by some objects and everything they reference
+    through containers and slots, counting shared objects once.
+    """
+    seen = set()
+    total = 0
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, (VideoRow, ChannelRow)):
+            stack.extend(getattr(obj, name) for name in obj.__slots__)
+    return total
+
+
+class Snapshot:
+    """
+    Immutable view of one ingest generation of the live tables.
+    """
+
+    def __init__(self, generation, videos, channels, load_seconds=0.0):
+        self.generation = generation
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.channels = {channel.channel_id: channel for channel in channels}
+
+        charts = defaultdict(list)
+        categories = defaultdict(list)
+        channel_videos = defaultdict(list)
+        for video in videos:
+            charts[(video.region, video.scrape_type, video.scrape_category)].append(video)
+            if video.category_id is not None:
+                categories[video.category_id].append(video)
+            if video.channel_id is not None:
+                channel_videos[video.channel_id].append(video)
+        self.video_count = len(videos)
+        # Each chart in rank order, categories and channels by views
+        self.charts = {
+            key: tuple(sorted(rows, key=lambda video: video.rank))
+            for key, rows in charts.items()
+        }
+        self.categories = {key: by_views(rows) for key, rows in categories.items()}
+        self.channel_videos = {key: by_views(rows) for key, rows in channel_videos.items()}
+        self.memory_bytes = deep_size(
+            [self.channels, self.charts, self.categories, self.channel_videos]
+        )
+
+    def chart(self, region, scrape_type, scrape_category=None):
+        return self.charts.get((region, scrape_type, scrape_category), ())
+
+    def category(self, category_id):
+        return self.categories.get(category_id, ())
+
+    def channel(self, channel_id):
+        return self.channels.get(channel_id), self.channel_videos.get(channel_id, ())
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "videos": self.video_count,
+            "channels": len(self.channels),
+            "charts": len(self.charts),
+            "memory_bytes": self.memory_bytes,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 4),
+        }
+
+
+def load_snapshot(session, generation):
+    """
+    Read the live tables into a snapshot of the given generation.
+    """
+    start = time.perf_counter()
+    video_columns = [VideoData.__table__.c[name] for name in VideoRow.__slots__]
+    channel_columns = [Channels.__table__.c[name] for name in ChannelRow.__slots__]
+    videos = [VideoRow(row) for row in session.execute(select(*video_columns)).mappings()]
+    channels = [
+        ChannelRow(row) for row in session.execute(select(*channel_columns)).mappings()
+    ]
+    return Snapshot(generation, videos, channels, time.perf_counter() - start)
+
+
+class SnapshotStore:
+    """
+    Hold the current snapshot of a worker and replace it when an ingest
+    commits. The generation is re-read at most every few seconds; one thread
+    reloads while the others keep serving the snapshot they already have.
+    """
+
+    def __init__(self, session_factory=ApiSessionLocal, check_interval=None):
+        self.session_factory = session_factory
+        self.check_interval = (
+            generation_check_interval if check_interval is None else check_interval
+        )
+        self.loads = 0
+        self._snapshot = None
+        self._checked = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _stale(self, snapshot):
+        return (
+            snapshot is None
+            or time.monotonic() - self._checked > self.check_interval
+        )
+
+    def _load_if_changed(self):
+        """
+        Load a new snapshot if the ingest generation moved. Called with the lock held.
+        Without a snapshot yet, a database error is raised; otherwise it is
+        logged and the previous snapshot is kept until the next check.
+        """
+        snapshot = self._snapshot
+        session = self.session_factory()
+        try:
+            # Generation and rows must come from the same commit
+            session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            generation = current_generation(session)
+            if snapshot is None or snapshot.generation != generation:
+                self._snapshot = load_snapshot(session, generation)
+                self.loads += 1
+                logger.info("Snapshot loaded", extra=self._snapshot.stats())
+        except SQLAlchemyError:
+            if snapshot is None:
+                raise
+            logger.exception(
+                "Error loading snapshot, serving the previous one",
+                extra={"generation": snapshot.generation},
+            )
+        finally:
+            session.close()
+            self._checked = time.monotonic()
+
+    def current(self):
+        """
+        Return the latest snapshot, loading it first if the generation moved.
+        While the background refresher runs, only the first load happens here.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and self._refreshing:
+            return snapshot
+        if not self._stale(snapshot):
+            return snapshot
+        # Only the first load makes requests wait
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._stale(self._snapshot):
+                self._load_if_changed()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """
+        Check the generation now, loading a new snapshot if it moved.
+        """
+        with self._lock:
+            self._load_if_changed()
+        return self._snapshot
+
+    def run_refresh(self, stopping):
+        """
+        Keep the snapshot current from a background thread until `stopping`
+        is set, so that requests never wait for the load after an ingest.
+        """
+        self._refreshing = True
+        try:
+            while True:
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Error refreshing snapshot")
+                if stopping.wait(self.check_interval):
+                    return
+        finally:
+            self._refreshing = False
+
+    def ready(self):
+        return self._snapshot is not None
+
+    def stats(self):
+        snapshot = self._snapshot
+        stats = snapshot.stats() if snapshot is not None else {"generation": None}
+        return {**stats, "loads": self.loads}
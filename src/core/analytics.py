@@ -0,0 +1,240 @@
+# Vectorised analytics over the history tables.
+# History is streamed through a server-side cursor in chunks that always hold
+# complete series, so memory is bounded by the chunk size rather than by the
+# size of the table. Deltas, growth rates, rank movement and moving averages
+# are computed with NumPy over each chunk and written back with COPY.
+
+import io
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Enum, String, cast, select, text
+
+from src.database.models import (
+    ChannelHistory,
+    ChannelMetrics,
+    VideoHistory,
+    VideoMetrics,
+)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100_000  # History rows fetched per round trip
+WINDOW = 7  # Snapshots covered by the moving averages
+
+# History table -> metrics table, the entity id it is streamed by, the columns
+# identifying one series, count fields to diff, fields to compute growth rates
+# and moving averages for, and whether chart ranks are tracked
+ANALYSES = {
+    VideoHistory: {
+        "metrics": VideoMetrics,
+        "key": "video_id",
+        # A video's rank only compares to its rank in the same chart
+        "series": ["video_id", "region", "scrape_type", "scrape_category"],
+        "deltas": ["view_count", "like_count", "comment_count"],
+        "growth": {"view_count": "view_growth_rate", "like_count": "like_growth_rate"},
+        "averages": {"view_count": "view_delta_avg"},
+        "rank": True,
+    },
+    ChannelHistory: {
+        "metrics": ChannelMetrics,
+        "key": "channel_id",
+        "series": ["channel_id"],
+        "deltas": ["view_count", "subscriber_count"],
+        "growth": {
+            "view_count": "view_growth_rate",
+            "subscriber_count": "subscriber_growth_rate",
+        },
+        "averages": {
+            "view_count": "view_delta_avg",
+            "subscriber_count": "subscriber_delta_avg",
+        },
+        "rank": False,
+    },
+}
+
+
+def history_columns(analysis):
+    """
+    Return the history columns an analysis reads, in load order.
+    """
+    columns = ["id", "scraped_at"] + analysis["series"] + analysis["deltas"]
+    if analysis["rank"]:
+        columns.append("rank")
+    return columns
+
+
+def iter_history_chunks(connection, history_class, chunk_size=CHUNK_SIZE):
+    """
+    Stream history rows as DataFrames through a server-side cursor.
+    Rows arrive grouped by entity, and the last entity of each chunk is held
+    back and prepended to the next one, so no series is split across chunks.
+    """
+    analysis = ANALYSES[history_class]
+    columns = history_columns(analysis)
+    history = history_class.__table__
+    key = history.c[analysis["key"]]
+    # Matches the (entity id, scraped_at DESC) index read backwards
+    # Enums are read as their labels, converting them costs more than the fetch
+    selected = [
+        (
+            cast(history.c[name], String).label(name)
+            if isinstance(history.c[name].type, Enum)
+            else history.c[name]
+        )
+        for name in columns
+    ]
+    query = (
+        select(*selected)
+        .order_by(key.desc(), history.c.scraped_at)
+        .execution_options(stream_results=True, max_row_buffer=chunk_size)
+    )
+    result = connection.execute(query)
+
+    carry = None
+    for rows in result.partitions(chunk_size):
+        frame = pd.DataFrame(rows, columns=columns)
+        if carry is not None:
+            frame = pd.concat([carry, frame], ignore_index=True)
+        last = frame[analysis["key"]].to_numpy() == frame[analysis["key"]].iat[-1]
+        carry = frame[last]
+        if not last.all():
+            yield frame[~last]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def shifted(values, first):
+    """
+    Return each row's previous value within its series, NaN on series starts.
+    """
+    previous = np.empty(len(values), dtype="float64")
+    previous[:1] = np.nan
+    previous[1:] = values[:-1]
+    previous[first] = np.nan
+    return previous
+
+
+def moving_average(values, start, window):
+    """
+    Average the last `window` non-null values of each row's series, using
+    prefix sums so the cost does not depend on the window size.
+    """
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    index = np.arange(len(values))
+    low = np.maximum(index - window + 1, start)
+    total = sums[index + 1] - sums[low]
+    count = counts[index + 1] - counts[low]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def compute_metrics(frame, analysis, window=WINDOW):
+    """
+    Compute per-snapshot metrics for a frame of complete series.
+    Rows are sorted by series and scrape time, after which every metric is an
+    array operation against the previous row, masked on the first row of each
+    series.
+    """
+    series = (
+        frame.groupby(analysis["series"], sort=False, dropna=False).ngroup().to_numpy()
+    )
+    scraped_at = frame["scraped_at"].to_numpy("datetime64[ns]")
+    # History id breaks ties between snapshots written at the same time
+    order = np.lexsort((frame["id"].to_numpy(), scraped_at, series))
+    frame = frame.iloc[order].reset_index(drop=True)
+    series = series[order]
+    scraped_at = scraped_at[order]
+
+    index = np.arange(len(frame))
+    first = np.ones(len(frame), dtype=bool)
+    first[1:] = series[1:] != series[:-1]
+    start = np.maximum.accumulate(np.where(first, index, 0))
+
+    hours = np.full(len(frame), np.nan)
+    hours[1:] = (scraped_at[1:] - scraped_at[:-1]) / np.timedelta64(1, "h")
+    hours[first] = np.nan
+
+    metrics = pd.DataFrame(
+        {
+            "history_id": frame["id"],
+            "scraped_at": frame["scraped_at"],
+            analysis["key"]: frame[analysis["key"]],
+        }
+    )
+    if analysis["rank"]:
+        rank = frame["rank"].to_numpy("float64", na_value=np.nan)
+        metrics["rank"] = pd.array(rank).astype("Int64")
+        # Positive when the video climbed the chart
+        metrics["rank_change"] = pd.array(shifted(rank, first) - rank).astype("Int64")
+
+    for field in analysis["deltas"]:
+        values = frame[field].to_numpy("float64", na_value=np.nan)
+        previous = shifted(values, first)
+        delta = values - previous
+        metrics[f"{field}_delta"] = pd.array(delta).astype("Int64")
+        if field in analysis["growth"]:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                growth = delta / previous / hours
+            growth[(previous <= 0) | (hours <= 0)] = np.nan
+            metrics[analysis["growth"][field]] = growth
+        if field in analysis["averages"]:
+            metrics[analysis["averages"][field]] = moving_average(delta, start, window)
+    return metrics
+
+
+def copy_frame(connection, frame, table_name):
+    """
+    Bulk load a DataFrame into a table with COPY, missing values as NULL.
+    """
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def analyse_history(
+    connection, history_class, chunk_size=CHUNK_SIZE, window=WINDOW, write=True
+):
+    """
+    Compute metrics for every snapshot in a history table and, unless `write`
+    is False, replace the contents of its metrics table with them.
+    Returns the number of snapshots analysed.
+    """
+    analysis = ANALYSES[history_class]
+    target = analysis["metrics"].__tablename__
+    start = time.perf_counter()
+    if write:
+        # Every snapshot is recomputed, so replace the table rather than
+        # upserting into it. DELETE rather than TRUNCATE: TRUNCATE's exclusive
+        # lock would block every reader until the COPYs commit, while after a
+        # DELETE readers keep seeing the old rows until then
+        connection.execute(text(f"DELETE FROM {target}"))
+    rows = 0
+    for frame in iter_history_chunks(connection, history_class, chunk_size):
+        metrics = compute_metrics(frame, analysis, window)
+        if write:
+            copy_frame(connection, metrics, target)
+        rows += len(metrics)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "History analysed",
+        extra={
+            "table": history_class.__tablename__,
+            "rows": rows,
+            "seconds": round(elapsed, 4),
+            "rows_per_second": round(rows / elapsed) if elapsed else 0,
+        },
+    )
+    return rows
@@ -1,22 +1,184 @@
+import json
+import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
+import httplib2
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from src import api_key
+from src import api_burst, api_key, api_max_retries, api_quota_budget, api_rate_limit
+from src.core.etag_cache import EtagCache
+from src.core.scheduler import (
+    QuotaBudgetExceeded,
+    RequestScheduler,
+    is_not_modified,
+)
+
+logger = logging.getLogger(__name__)
 
 # Build youtube client
 youtube = build("youtube", "v3", developerKey=api_key)
 
+# Every request goes through the scheduler for rate limiting, quota and retries
+scheduler = RequestScheduler(
+    rate=api_rate_limit,
+    burst=api_burst,
+    quota_budget=api_quota_budget,
+    max_retries=api_max_retries,
+)
+
+# Responses and channel rows kept between runs for conditional requests
+etag_cache = EtagCache()
+
+# YouTube API allows a maximum of 50 IDs per request
+CHANNEL_BATCH_SIZE = 50
+
+# Per-thread HTTP connections for concurrent scraping
+_local = threading.local()
+
+
+def thread_http():
+    """
+    Return an HTTP connection for the calling thread to execute requests with.
+    httplib2 is not thread-safe, so worker threads each get their own connection;
+    the main thread returns None and keeps using the client's default one.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return None
+    if not hasattr(_local, "http"):
+        _local.http = httplib2.Http()
+    return _local.http
+
+
+def request_key(resource, params):
+    """
+    Return the ETag cache key of a list request.
+    """
+    return f"{resource}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def channel_key(channel_id):
+    """
+    Return the ETag cache key of a single channel item.
+    """
+    return f"channel:{channel_id}"
+
+
+def execute_conditional(request, key):
+    """
+    Execute a request through the scheduler, sending the cached ETag for its
+    key as If-None-Match. A 304 returns the cached response; any other
+    response is cached under its new ETag.
+    """
+    cached = etag_cache.get(key)
+    if cached is not None:
+        request.headers["If-None-Match"] = cached[0]
+    try:
+        response = scheduler.execute(request, http=thread_http())
+    except HttpError as e:
+        if cached is not None and is_not_modified(e):
+            etag_cache.record_not_modified(key)
+            return cached[1]
+        raise
+    etag_cache.put(key, response.get("etag"), response)
+    return response
+
 
+@lru_cache(maxsize=None)
 def camel_to_snake(name):
     s1 = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", name)
     return re.sub("([a-z0-9])([A-Z])", r"\1_\2", s1).lower()
 
 
-def scrape_data(category_id=None):
+# API fields kept from each part of a response item, translated once at import
+# into the snake_case row keys used by the database models
+VIDEO_PARTS = {
+    "snippet": [
+        "publishedAt",
+        "channelId",
+        "title",
+        "description",
+        "channelTitle",
+        "tags",
+        "categoryId",
+    ],
+    "statistics": ["viewCount", "likeCount", "commentCount"],
+    "contentDetails": ["duration"],
+}
+CHANNEL_PARTS = {
+    "snippet": ["title", "description", "publishedAt"],
+    "statistics": ["viewCount", "subscriberCount", "videoCount"],
+}
+VIDEO_KEYS = {
+    part: [(key, camel_to_snake(key)) for key in keys]
+    for part, keys in VIDEO_PARTS.items()
+}
+CHANNEL_KEYS = {
+    part: [(key, camel_to_snake(key)) for key in keys]
+    for part, keys in CHANNEL_PARTS.items()
+}
+
+
+def flatten_parts(item, part_keys, row):
     """
-    Scrape popular videos from Youtube API and return as Python list of dictionaries
+    Copy the wanted fields of each part of an API item into a flat row.
+    """
+    for part, keys in part_keys.items():
+        values = item.get(part)
+        if values:
+            for key, column in keys:
+                if key in values:
+                    row[column] = values[key]
+    return row
+
+
+def join_tags(tags):
+    """
+    Join a list of tags with commas, truncated to 500 chars.
+    """
+    tags_string = ", ".join(tags)
+    if len(tags_string) > 500:
+        # Truncate at last complete tag that fits within 500 chars
+        truncated = tags_string[:497]  # Leave room for "..."
+        last_comma = truncated.rfind(", ")
+        if last_comma > 0:
+            tags_string = truncated[:last_comma] + "..."
+        else:
+            tags_string = truncated + "..."
+    return tags_string
+
+
+def normalise_video(video):
+    """
+    Turn a raw video item into a flat row keyed by VideoData column names.
+    """
+    row = flatten_parts(video, VIDEO_KEYS, {"video_id": video.get("id")})
+    # Handle tags conversion - convert list to comma-separated string
+    if isinstance(row.get("tags"), list):
+        # The list is kept whole for tag search, the string is for display
+        row["tag_list"] = row["tags"]
+        row["tags"] = join_tags(row["tags"])
+    return row
+
+
+def normalise_channel(channel):
+    """
+    Turn a raw channel item into a flat row keyed by Channels column names.
+    """
+    # Rename 'id' to 'channel_id' for DB consistency
+    return flatten_parts(channel, CHANNEL_KEYS, {"channel_id": channel.get("id")})
+
+
+def scrape_data(category_id=None, recorder=None, channel_sink=None, region_code="US"):
+    """
+    Scrape popular videos in a region from Youtube API and return as Python list of dictionaries
+    If a recorder is given, each raw item is written to it before normalisation.
+    If a channel_sink is given, it is called with each page's channel ids as
+    soon as the page arrives.
     """
     videos = []
     channel_ids = set()
@@ -25,7 +187,7 @@ def scrape_data(category_id=None):
     request_params = {
         "part": "snippet, statistics, contentDetails",
         "chart": "mostPopular",
-        "regionCode": "US",
+        "regionCode": region_code,
         "maxResults": 50,
     }
 
@@ -40,39 +202,22 @@ def scrape_data(category_id=None):
         request = youtube.videos().list(**request_params)
         # Loop through the pages of results
         while request:
-            response = request.execute()
-            items = response.get("items", [])
-            videos.extend(items)
-
-            # Extract channel IDs to handle Channel table
-            for video in items:
-                channel_id = video.get("snippet", {}).get("channelId")
-                if channel_id:
-                    channel_ids.add(channel_id)
-                
-                # Handle tags conversion - convert list to comma-separated string
-                snippet = video.get("snippet", {})
-                if "tags" in snippet and isinstance(snippet["tags"], list):
-                    # Join tags with commas, truncate to 500 chars if needed
-                    tags_string = ", ".join(snippet["tags"])
-                    if len(tags_string) > 500:
-                        # Truncate at last complete tag that fits within 500 chars
-                        truncated = tags_string[:497]  # Leave room for "..."
-                        last_comma = truncated.rfind(", ")
-                        if last_comma > 0:
-                            tags_string = truncated[:last_comma] + "..."
-                        else:
-                            tags_string = truncated + "..."
-                    snippet["tags"] = tags_string
-                
-                for key in video:
-                    # Convert keys to snake_case
-                    if isinstance(video[key], dict):
-                        subkeys = list(video[key].keys())
-                        for subkey in subkeys:
-                            snake_subkey = camel_to_snake(subkey)
-                            if subkey != snake_subkey:
-                                video[key][snake_subkey] = video[key].pop(subkey)
+            response = execute_conditional(
+                request, request_key("videos", request_params)
+            )
+
+            page_channel_ids = set()
+            for video in response.get("items", []):
+                if recorder is not None:
+                    recorder.write(video)
+                row = normalise_video(video)
+                # Extract channel IDs to handle Channel table
+                if row.get("channel_id"):
+                    page_channel_ids.add(row["channel_id"])
+                videos.append(row)
+            channel_ids.update(page_channel_ids)
+            if channel_sink is not None:
+                channel_sink(page_channel_ids)
 
             # Get next page token
             next_token = response.get("nextPageToken")
@@ -86,55 +231,134 @@ def scrape_data(category_id=None):
             video["rank"] = (
                 idx + 1
             )  # Add rank to each video based on its position in the list
+    except QuotaBudgetExceeded:
+        # Every remaining chart would fail the same way, so the run must stop
+        raise
     # Some categories do not return any videos under the mostPopular chart, but still have videos assigned to them, returning 404
     except HttpError as e:
-        print(f"HTTP error {e.resp.status}: {e.content}")
+        logger.warning(
+            "HTTP error scraping chart",
+            extra={
+                "status": e.resp.status,
+                "region": region_code,
+                "category": category_id,
+                "error": str(e),
+            },
+        )
         return [], []
-    except Exception as e:
-        print(f"Error fetching data for category {category_id}: {e}")
+    except Exception:
+        logger.exception(
+            "Error scraping chart",
+            extra={"region": region_code, "category": category_id},
+        )
         return [], []
 
     return videos, list(channel_ids)
 
 
-def get_channel_data(channel_ids):
+def get_channel_data(channel_ids, recorder=None):
     """
     Fetch channel data from Youtube API and return as Python list of dictionaries
+    If a recorder is given, each raw item is written to it before normalisation.
+    Channels whose ETag is unchanged since the last run reuse their cached row.
     """
     channels = []
 
     # YouTube API allows a maximum of 50 IDs per request
-    batch_size = 50
+    batch_size = CHANNEL_BATCH_SIZE
     for i in range(0, len(channel_ids), batch_size):
         # Get the current batch of up to 50 channel IDs
         batch = channel_ids[i : i + batch_size]
 
         # Make the API request
         request = youtube.channels().list(part="snippet,statistics", id=batch)
-        response = request.execute()
+        response = execute_conditional(
+            request, request_key("channels", sorted(batch))
+        )
 
         # Add the channels from this batch to the result
         for channel in response.get("items", []):
-            # Rename 'id' to 'channel_id' for DB consistency
-            channel["channel_id"] = channel.pop("id", None)
-            for key in channel:
-                # Convert keys to snake_case
-                if isinstance(channel[key], dict):
-                    subkeys = list(channel[key].keys())
-                    for subkey in subkeys:
-                        snake_subkey = camel_to_snake(subkey)
-                        if subkey != snake_subkey:
-                            channel[key][snake_subkey] = channel[key].pop(subkey)
-            channels.append(channel)
+            if recorder is not None:
+                recorder.write(channel)
+            channels.append(
+                etag_cache.item(
+                    channel_key(channel.get("id")), channel, normalise_channel
+                )
+            )
 
     return channels
 
 
-def get_video_categories():
+class ChannelFetcher:
+    """
+    Collect channel ids while videos are being scraped and fetch them in
+    batches of 50. With workers > 0, each full batch is dispatched to a thread
+    pool as soon as it fills, so the channel requests overlap the video scrape;
+    with 0, every id is fetched serially once scraping has finished.
+    Ids already queued this run are skipped.
+    """
+
+    def __init__(self, workers=0, recorder=None):
+        self.recorder = recorder
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._pending = []
+        self._futures = []
+
+    def add(self, channel_ids):
+        """
+        Queue newly discovered channel ids. Safe to call from scrape workers.
+        """
+        with self._lock:
+            # Sorted so that batches, and their ETag cache keys, repeat across runs
+            for channel_id in sorted(channel_ids):
+                if channel_id not in self._seen:
+                    self._seen.add(channel_id)
+                    self._pending.append(channel_id)
+            if self._executor is not None:
+                while len(self._pending) >= CHANNEL_BATCH_SIZE:
+                    self._submit(self._pending[:CHANNEL_BATCH_SIZE])
+                    self._pending = self._pending[CHANNEL_BATCH_SIZE:]
+
+    def _submit(self, batch):
+        self._futures.append(
+            self._executor.submit(get_channel_data, batch, self.recorder)
+        )
+
+    def result(self):
+        """
+        Fetch any remaining ids and return every channel fetched this run.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if self._executor is None:
+            channels = get_channel_data(pending, self.recorder)
+        else:
+            if pending:
+                self._submit(pending)
+            channels = []
+            try:
+                for future in self._futures:
+                    channels.extend(future.result())
+            finally:
+                self._executor.shutdown()
+        logger.info(
+            "Channels fetched",
+            extra={
+                "channels": len(channels),
+                "waited": round(time.perf_counter() - start, 4),
+            },
+        )
+        return channels
+
+
+def get_video_categories(region_code="US"):
     """
     Fetch video categories from Youtube API and return as Python list of dictionaries
     """
-    request = youtube.videoCategories().list(part="snippet", regionCode="US")
-    response = request.execute()
+    request = youtube.videoCategories().list(part="snippet", regionCode=region_code)
+    response = scheduler.execute(request)
     categories = response.get("items", [])
     return categories
@@ -0,0 +1,245 @@
+# Parquet export and archival of the history tables.
+# Rows are streamed month by month through a server-side cursor into
+# zstd-compressed Parquet files laid out as <table>/month=YYYY-MM/part-*.parquet,
+# matching the monthly database partitions. Exports are incremental: only rows
+# newer than the latest scraped_at already on disk are written.
+# pyarrow is imported on first use so the rest of the CLI does not need it.
+
+import logging
+import os
+from datetime import datetime, time
+
+from sqlalchemy import (
+    ARRAY,
+    BigInteger,
+    Boolean,
+    DateTime,
+    Enum,
+    Float,
+    Integer,
+    Interval,
+    String,
+    cast,
+    delete,
+    func,
+    select,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from src.database.models import ChannelHistory, VideoHistory
+from src.database.partitions import detach_partitions, month_start
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CLASSES = [VideoHistory, ChannelHistory]
+CHUNK_SIZE = 100_000  # Rows per fetch and per Parquet row group
+
+
+def load_pyarrow():
+    """
+    Import pyarrow and its Parquet module.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet export needs pyarrow, run 'pip install pyarrow'.") from e
+    return pyarrow, pyarrow.parquet
+
+
+def exported_columns(table):
+    """
+    Return the columns of a history table that are exported. Search vectors
+    are left out, they can be rebuilt from the text.
+    """
+    return [column for column in table.columns if not isinstance(column.type, TSVECTOR)]
+
+
+def arrow_schema(table):
+    """
+    Build the Parquet schema for a history table from its column types.
+    """
+    pa, _ = load_pyarrow()
+    fields = []
+    for column in exported_columns(table):
+        column_type = column.type
+        if isinstance(column_type, ARRAY):
+            arrow_type = pa.list_(pa.string())
+        elif isinstance(column_type, BigInteger):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int32()
+        elif isinstance(column_type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column_type, Interval):
+            arrow_type = pa.duration("us")
+        else:
+            # Text, String and Enum columns, enums are exported as their labels
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+def table_dir(export_dir, table):
+    return os.path.join(export_dir, table.name)
+
+
+def exported_until(export_dir, table):
+    """
+    Return the latest scraped_at already exported for a table, read from the
+    Parquet row group statistics, or None if nothing has been exported.
+    """
+    _, pq = load_pyarrow()
+    latest = None
+    for root, _, files in os.walk(table_dir(export_dir, table)):
+        for name in files:
+            if not name.endswith(".parquet"):
+                continue
+            metadata = pq.read_metadata(os.path.join(root, name))
+            index = metadata.schema.names.index("scraped_at")
+            for group in range(metadata.num_row_groups):
+                stats = metadata.row_group(group).column(index).statistics
+                if stats is not None and stats.has_min_max:
+                    if latest is None or stats.max > latest:
+                        latest = stats.max
+    return latest
+
+
+def export_table(connection, history_class, export_dir, before=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream history rows newer than the last export (and older than `before`)
+    into one Parquet file per month.
+    Returns the number of rows written.
+    """
+    pa, pq = load_pyarrow()
+    table = history_class.__table__
+    schema = arrow_schema(table)
+    selected = [
+        cast(column, String).label(column.name) if isinstance(column.type, Enum) else column
+        for column in exported_columns(table)
+    ]
+
+    bounds = [table.c.scraped_at < before] if before is not None else []
+    since = exported_until(export_dir, table)
+    if since is not None:
+        bounds.append(table.c.scraped_at > since)
+    first, last = connection.execute(
+        select(func.min(table.c.scraped_at), func.max(table.c.scraped_at)).where(*bounds)
+    ).one()
+    if first is None:
+        logger.info("Nothing new to export", extra={"table": table.name})
+        return 0
+
+    written = 0
+    month = month_start(first.date())
+    while month <= last.date():
+        following = month_start(month, 1)
+        query = (
+            select(*selected)
+            .where(
+                *bounds,
+                table.c.scraped_at >= month,
+                table.c.scraped_at < following,
+            )
+            # Sorted rows give tight scraped_at statistics per row group
+            .order_by(table.c.scraped_at, table.c.id)
+            .execution_options(stream_results=True, max_row_buffer=chunk_size)
+        )
+        writer = None
+        path = None
+        try:
+            for rows in connection.execute(query).partitions(chunk_size):
+                if writer is None:
+                    directory = os.path.join(
+                        table_dir(export_dir, table), f"month={month:%Y-%m}"
+                    )
+                    os.makedirs(directory, exist_ok=True)
+                    path = os.path.join(
+                        directory, f"part-{rows[0].scraped_at:%Y%m%dT%H%M%S%f}.parquet"
+                    )
+                    writer = pq.ParquetWriter(path, schema, compression="zstd")
+                columns = [
+                    pa.array(values, type=field.type)
+                    for values, field in zip(zip(*rows), schema)
+                ]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                written += len(rows)
+        except BaseException:
+            # Never leave a partial file behind, the next export would skip its rows
+            if writer is not None:
+                writer.close()
+                os.remove(path)
+            raise
+        if writer is not None:
+            writer.close()
+        month = following
+    logger.info(
+        "History exported",
+        extra={
+            "table": table.name,
+            "rows": written,
+            "path": table_dir(export_dir, table),
+        },
+    )
+    return written
+
+
+def archive_history(connection, export_dir, cutoff):
+    """
+    Delete history rows scraped before the cutoff date once they are in the
+    export. Whole months go by dropping their partitions, the rest by DELETE.
+    """
+    limit = datetime.combine(cutoff, time.min)
+    for history_class in HISTORY_CLASSES:
+        table = history_class.__table__
+        exported = exported_until(export_dir, table)
+        missing = select(func.count()).where(table.c.scraped_at < limit)
+        if exported is not None:
+            missing = missing.where(table.c.scraped_at > exported)
+        if connection.execute(missing).scalar():
+            raise RuntimeError(
+                f"{table.name} has rows before {cutoff} that are not exported yet."
+            )
+
+    detach_partitions(connection, cutoff, drop=True)
+    for history_class in HISTORY_CLASSES:
+        table = history_class.__table__
+        deleted = connection.execute(
+            delete(table).where(table.c.scraped_at < limit)
+        ).rowcount
+        logger.info(
+            "Deleted archived rows outside dropped partitions",
+            extra={"table": table.name, "rows": deleted},
+        )
+
+
+def export_history(connection, export_dir, before=None, archive=False):
+    """
+    Export both history tables, then optionally archive rows before `before`.
+    """
+    limit = datetime.combine(before, time.min) if before is not None else None
+    for history_class in HISTORY_CLASSES:
+        export_table(connection, history_class, export_dir, before=limit)
+    if archive:
+        archive_history(connection, export_dir, before)
+
+
+def read_history(export_dir, table_name, columns=None, filters=None):
+    """
+    Read exported history into an Arrow table without touching the database.
+    Files are memory-mapped, and column selection and filters such as
+    [("scraped_at", ">=", datetime(2025, 1, 1))] are pushed down so only the
+    matching columns and row groups are read. Use .to_pandas() for a DataFrame.
+    """
+    _, pq = load_pyarrow()
+    return pq.read_table(
+        os.path.join(export_dir, table_name),
+        columns=columns,
+        filters=filters,
+        memory_map=True,
+        partitioning="hive",
+    )
@@ -0,0 +1,180 @@
+# Long-running ingest scheduler.
+# The daemon keeps one process alive so the YouTube client, request scheduler
+# and ingest connection pool stay warm between runs, and starts an ingest
+# every interval plus or minus a random jitter. Overlapping runs, from this or
+# any other process, are prevented by the ingest advisory lock. The last run's
+# outcome and timings are served as JSON on a small health endpoint.
+
+import json
+import logging
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import (
+    daemon_health_host,
+    daemon_health_port,
+    daemon_interval,
+    daemon_jitter,
+)
+from src.core.ingest_data import ingest_data
+from src.database.database import api_engine, engine
+from src.database.engine import pool_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def utc_iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+class IngestDaemon:
+    """
+    Run ingest_data periodically until stopped, tracking health as it goes.
+    """
+
+    def __init__(self, interval=daemon_interval, jitter=daemon_jitter, **ingest_options):
+        self.interval = interval
+        self.jitter = jitter
+        self.ingest_options = ingest_options
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.running_since = None
+        self.next_run_at = None
+        self.last_run = None
+        self.last_finished_at = None
+        self.last_success_at = None
+        self.runs = {"success": 0, "failed": 0, "skipped": 0}
+        self.consecutive_failures = 0
+
+    def next_delay(self):
+        """
+        Seconds until the next run, spread by the jitter so that several
+        deployments do not hit the API in lockstep.
+        """
+        return max(self.interval + random.uniform(-self.jitter, self.jitter), 0)
+
+    def run_once(self):
+        with self.lock:
+            self.running_since = time.time()
+            self.next_run_at = None
+        try:
+            summary = ingest_data(**self.ingest_options)
+        except Exception as e:
+            # ingest_data handles its own errors, this only guards the loop
+            logger.exception("Ingest run crashed")
+            summary = {"status": "failed", "error": str(e)}
+        with self.lock:
+            self.running_since = None
+            self.last_run = summary
+            self.last_finished_at = time.time()
+            status = summary["status"]
+            self.runs[status] = self.runs.get(status, 0) + 1
+            if status == "success":
+                self.last_success_at = self.last_finished_at
+                self.consecutive_failures = 0
+            elif status == "failed":
+                self.consecutive_failures += 1
+
+    def run(self):
+        """
+        Ingest immediately, then on every interval until stop() is called.
+        A run in progress is always allowed to finish.
+        """
+        logger.info(
+            "Ingest daemon started",
+            extra={"interval": self.interval, "jitter": self.jitter},
+        )
+        while not self.stopping.is_set():
+            self.run_once()
+            delay = self.next_delay()
+            with self.lock:
+                self.next_run_at = time.time() + delay
+            logger.info("Next ingest scheduled", extra={"seconds": round(delay, 1)})
+            self.stopping.wait(delay)
+        logger.info("Ingest daemon stopped")
+
+    def stop(self):
+        self.stopping.set()
+
+    def health(self):
+        """
+        Return (healthy, report). The daemon is unhealthy once the last run
+        failed or no run has succeeded for three intervals.
+        """
+        now = time.time()
+        with self.lock:
+            last_ok = self.last_success_at or self.started_at
+            stale = now - last_ok > 3 * (self.interval + self.jitter)
+            healthy = self.consecutive_failures == 0 and not stale
+            report = {
+                "status": "ok" if healthy else "unhealthy",
+                "started_at": utc_iso(self.started_at),
+                "running_since": utc_iso(self.running_since),
+                "next_run_at": utc_iso(self.next_run_at),
+                "last_finished_at": utc_iso(self.last_finished_at),
+                "last_success_at": utc_iso(self.last_success_at),
+                "consecutive_failures": self.consecutive_failures,
+                "runs": dict(self.runs),
+                "last_run": self.last_run,
+                "db_pool": pool_metrics(engine),
+            }
+        return healthy, report
+
+
+def health_server(daemon, host=daemon_health_host, port=daemon_health_port):
+    """
+    Create an HTTP server answering GET /health with the daemon's report,
+    status 200 when healthy and 503 otherwise.
+    """
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/health":
+                self.send_error(404)
+                return
+            healthy, report = daemon.health()
+            body = json.dumps(report, default=str).encode()
+            self.send_response(200 if healthy else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("Health request", extra={"request": format % args})
+
+    return ThreadingHTTPServer((host, port), HealthHandler)
+
+
+def run_daemon(**ingest_options):
+    """
+    Run the ingest daemon in the foreground until SIGINT or SIGTERM.
+    """
+    daemon = IngestDaemon(**ingest_options)
+    server = health_server(daemon)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(
+        "Health endpoint listening",
+        extra={"host": server.server_address[0], "port": server.server_address[1]},
+    )
+
+    def handle_signal(signum, frame):
+        logger.info("Shutdown requested", extra={"signal": signal.Signals(signum).name})
+        daemon.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    try:
+        daemon.run()
+    finally:
+        server.shutdown()
+        server.server_close()
+        engine.dispose()
+        api_engine.dispose()
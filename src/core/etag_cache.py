@@ -0,0 +1,194 @@
+# Persistent ETag cache for conditional YouTube API requests.
+# Responses are stored with their ETag in api_etags, keyed by request
+# parameters, and the next run sends the ETag as If-None-Match: a 304 reuses
+# the stored payload instead of transferring the page again. Channel items are
+# also cached one by one with their normalised row, so a channel whose item
+# ETag is unchanged skips normalisation and, in incremental mode, the upsert.
+# The cache is loaded at the start of each live ingest and saved in the same
+# transaction as the ingested data, so it never runs ahead of the database.
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src import etag_cache_enabled, etag_cache_max_bytes
+from src.database.models import ApiEtag
+
+logger = logging.getLogger(__name__)
+
+
+def payload_size(payload):
+    """
+    Approximate the transferred size of a payload by its JSON encoding.
+    """
+    return len(json.dumps(payload, separators=(",", ":")).encode())
+
+
+class EtagCache:
+    """
+    Size-bounded LRU of (etag, payload) entries, shared by the scrape and
+    channel worker threads of one ingest run.
+    """
+
+    def __init__(self, max_bytes=etag_cache_max_bytes, enabled=etag_cache_enabled):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._entries = OrderedDict()  # key -> (etag, payload, size)
+        self.size = 0
+        self._dirty = set()
+        self._used = set()
+        self._evicted = set()
+        self.unchanged = set()
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def start_run(self, session):
+        """
+        Load the stored entries, most recently used last, and reset the metrics.
+        """
+        with self._lock:
+            self._reset()
+        if not self.enabled:
+            return
+        rows = session.execute(
+            select(ApiEtag.key, ApiEtag.etag, ApiEtag.payload, ApiEtag.size).order_by(
+                ApiEtag.used_at
+            )
+        )
+        with self._lock:
+            for key, etag, payload, size in rows:
+                self._entries[key] = (etag, payload, size)
+                self.size += size
+            self._evict()
+        logger.info(
+            "ETag cache loaded",
+            extra={"entries": len(self._entries), "bytes": self.size},
+        )
+
+    def get(self, key):
+        """
+        Return the (etag, payload) stored under a key, or None.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._used.add(key)
+            return entry[0], entry[1]
+
+    def put(self, key, etag, payload):
+        if not self.enabled or not etag:
+            return
+        size = payload_size(payload)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self._entries[key] = (etag, payload, size)
+            self.size += size
+            self._dirty.add(key)
+            self._evicted.discard(key)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            key, (_, _, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self._dirty.discard(key)
+            self._used.discard(key)
+            self._evicted.add(key)
+
+    def record_not_modified(self, key):
+        """
+        Count a 304 answered for a cached response.
+        """
+        with self._lock:
+            self.not_modified += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.bytes_saved += entry[2]
+
+    def item(self, key, item, normalise):
+        """
+        Return the normalised row of an API item, reusing the cached row when
+        the item's ETag is unchanged and caching it otherwise.
+        """
+        cached = self.get(key)
+        if cached is not None and cached[0] == item.get("etag"):
+            with self._lock:
+                self.unchanged.add(key)
+            return dict(cached[1])
+        row = normalise(item)
+        self.put(key, item.get("etag"), row)
+        return row
+
+    def is_unchanged(self, key):
+        return key in self.unchanged
+
+    def save(self, session):
+        """
+        Write new and changed entries, mark reused ones as recently used and
+        delete evicted ones, as part of the caller's transaction.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            dirty = [
+                {
+                    "key": key,
+                    "etag": self._entries[key][0],
+                    "payload": self._entries[key][1],
+                    "size": self._entries[key][2],
+                }
+                for key in self._dirty
+            ]
+            used = list(self._used - self._dirty)
+            evicted = list(self._evicted)
+        if dirty:
+            stmt = pg_insert(ApiEtag).values(used_at=func.now())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ApiEtag.key],
+                set_={
+                    "etag": stmt.excluded.etag,
+                    "payload": stmt.excluded.payload,
+                    "size": stmt.excluded.size,
+                    "used_at": func.now(),
+                },
+            )
+            session.execute(stmt, dirty)
+        if used:
+            session.execute(
+                update(ApiEtag).where(ApiEtag.key.in_(used)).values(used_at=func.now())
+            )
+        if evicted:
+            session.execute(delete(ApiEtag).where(ApiEtag.key.in_(evicted)))
+        logger.info(
+            "ETag cache saved",
+            extra={
+                "written": len(dirty),
+                "reused": len(used),
+                "evicted": len(evicted),
+                "bytes": self.size,
+            },
+        )
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "not_modified": self.not_modified,
+                "bytes_saved": self.bytes_saved,
+                "items_unchanged": len(self.unchanged),
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
@@ -1,58 +1,312 @@
-from sqlalchemy import distinct, func, select, update
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 
-from src.core.api import get_channel_data, scrape_data
-from src.database.database import SessionLocal, ingest_table, move_old_data
+from src import channel_workers, ingest_mode, scrape_regions, scrape_workers
+from src.core.api import (
+    ChannelFetcher,
+    channel_key,
+    etag_cache,
+    scheduler,
+    scrape_data,
+)
+from src.core.logs import RunStats
+from src.core.replay import (
+    record_categories,
+    recording,
+    replay_categories,
+    replay_channels,
+    replay_video_files,
+    replay_videos,
+    video_file_name,
+)
+from src.core.scheduler import QuotaBudgetExceeded
+from src.database.database import (
+    SessionLocal,
+    append_history,
+    bulk_ingest,
+    bump_generation,
+    delete_stale,
+    engine,
+    existing_keys,
+    ingest_lock,
+    ingest_table,
+    move_old_data,
+    refresh_channel_aggregates,
+    save_ingest_run,
+    upsert_table,
+)
+from src.database.engine import pool_metrics
+from src.database.leaderboards import refresh_leaderboards
 from src.database.models import Categories, Channels, VideoData, VideoType
+from src.database.partitions import ensure_partitions
+from src.database.rollups import refresh_rollups
 
+logger = logging.getLogger(__name__)
 
-def ingest_data():
+
+class IngestLocked(Exception):
+    """
+    Raised when another ingest holds the ingest lock.
+    """
+
+
+def timed_scrape(chart, record_dir=None, channel_sink=None):
+    """
+    Scrape a single (region, category) chart and report its timing.
+    A category of None is the region's general popular chart.
+    """
+    region, category_id = chart
+    start = time.perf_counter()
+    with recording(record_dir, video_file_name(region, category_id)) as recorder:
+        videos, channel_ids = scrape_data(
+            category_id, recorder, channel_sink, region_code=region
+        )
+    logger.info(
+        "Chart scraped",
+        extra={
+            "region": region,
+            "category": category_id if category_id is not None else "popular",
+            "videos": len(videos),
+            "seconds": round(time.perf_counter() - start, 4),
+        },
+    )
+    return videos, channel_ids
+
+
+def scrape_charts(charts, workers=1, record_dir=None, channel_sink=None):
+    """
+    Scrape the given (region, category) charts, concurrently when workers > 1.
+    Results are returned in the same order as charts regardless of
+    which scrape finishes first, so ranks and deduplication are unaffected.
+    """
+    start = time.perf_counter()
+    scrape = partial(timed_scrape, record_dir=record_dir, channel_sink=channel_sink)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(scrape, charts))
+    else:
+        results = [scrape(chart) for chart in charts]
+    logger.info(
+        "Charts scraped",
+        extra={
+            "charts": len(charts),
+            "workers": workers,
+            "seconds": round(time.perf_counter() - start, 4),
+        },
+    )
+    return results
+
+
+def log_api_metrics(stats):
+    """
+    Report the API requests, retries, quota and latency of this run and add
+    them to the run counters.
+    """
+    metrics = scheduler.metrics()
+    stats.update(
+        {
+            "api_requests": metrics["requests"],
+            "api_retries": metrics["retries"],
+            "api_failures": metrics["failures"],
+            "api_not_modified": metrics["not_modified"],
+            "api_quota_spent": metrics["quota_spent"],
+        }
+    )
+    logger.info("API usage", extra=metrics)
+
+
+def log_etag_metrics(stats):
+    """
+    Report what the ETag cache saved this run and add it to the run counters.
+    Every 304 is a response that did not have to be transferred or parsed.
+    """
+    metrics = etag_cache.metrics()
+    stats.update(
+        {
+            "etag_not_modified": metrics["not_modified"],
+            "etag_bytes_saved": metrics["bytes_saved"],
+            "etag_items_unchanged": metrics["items_unchanged"],
+        }
+    )
+    logger.info("ETag cache usage", extra=metrics)
+
+
+def split_unchanged_channels(session, channels):
+    """
+    Split channels into those that must be upserted and the number that can
+    be skipped: channels whose cached ETag matched and whose row is still live.
+    """
+    unchanged = [
+        channel["channel_id"]
+        for channel in channels
+        if etag_cache.is_unchanged(channel_key(channel["channel_id"]))
+    ]
+    if not unchanged:
+        return channels, 0
+    live = existing_keys(session, Channels, unchanged)
+    changed = [channel for channel in channels if channel["channel_id"] not in live]
+    return changed, len(channels) - len(changed)
+
+
+def log_pool_metrics(stats):
+    """
+    Report how the ingest connection pool was used and add it to the run
+    counters.
+    """
+    metrics = pool_metrics(engine)
+    stats.update(
+        {"db_checkouts": metrics["checkouts"], "db_timeouts": metrics["timeouts"]}
+    )
+    logger.info("DB pool usage", extra=metrics)
+
+
+def ingest_data(
+    workers=scrape_workers,
+    mode=ingest_mode,
+    replay_path=None,
+    record_dir=None,
+    regions=scrape_regions,
+):
     """
     Ingest data from the YouTube API into the database.
+    In "incremental" mode the live tables are upserted in place instead of
+    being moved to history and reloaded.
+    With replay_path, saved API responses are ingested instead of live ones;
+    with record_dir, the raw responses of a live run are saved for replay.
+    Every category chart is scraped in each of the given regions.
+    Only one ingest runs against a database at a time; a run that finds
+    another in progress is skipped. A run that reaches the API quota budget
+    stops and is recorded as failed rather than storing a partial scrape;
+    like any failed run, it leaves the previous scrape in the live tables.
+    Phase timings and counters are logged and saved to ingest_runs.
+    Returns the run summary.
     """
+    incremental = mode == "incremental"
+    stats = RunStats()
+    status, error = "failed", None
     session = SessionLocal()
+    recordings = ExitStack()
+    lock = ExitStack()
     try:
-        move_old_data(session)
-
-        categories = session.query(Categories).all()
-
-        # Scrape popular videos in each category
-        cat_videos, channel_ids = [], set()
-        for category in categories:
-            print(f"Scraping category: {category.category_id}")
-            if not category.assignable:
-                continue
-            cat_video_data, cat_channel_data = scrape_data(category.category_id)
-            for video in cat_video_data:
-                video["scrape_type"] = (
-                    VideoType.category
-                )  # Set scrape type for category videos
-                video["scrape_category"] = category.category_id
-            cat_videos.extend(cat_video_data)
-            channel_ids.update(cat_channel_data)
-        # Scrape popular videos in general
-        pop_videos, pop_channel_ids = scrape_data()
-        for video in pop_videos:
-            video["scrape_type"] = VideoType.popular  # Set scrape type for popular videos
-            video["scrape_category"] = None  # No category for general popular videos
-
-        channel_ids.update(pop_channel_ids)
-
-        videos = cat_videos + pop_videos
-
-        # Deduplicate videos based on unique constraints
-        seen_videos = set()
-        unique_videos = []
-        for video in videos:
-            if (video["id"], video["scrape_type"], video["scrape_category"]) not in seen_videos:
-                seen_videos.add((video["id"], video["scrape_type"], video["scrape_category"]))
-                video["video_id"] = video.pop("id")  # Rename id to video_id
-                unique_videos.append(video)
-
-        print(
-            f"Scraped {len(channel_ids)} channels, {len(cat_videos)} category videos, {len(pop_videos)} popular videos."
+        if not lock.enter_context(ingest_lock()):
+            raise IngestLocked()
+        with stats.phase("partitions"):
+            # History rows land in this month's partition. Created in a
+            # transaction of their own, so the ingest does not hold the
+            # partition DDL locks on the history tables until it commits
+            with engine.begin() as connection:
+                ensure_partitions(connection)
+
+        if replay_path is None:
+            with stats.phase("scrape"):
+                scheduler.start_run()
+                etag_cache.start_run(session)
+                categories = session.query(Categories).all()
+                category_ids = [
+                    category.category_id
+                    for category in categories
+                    if category.assignable
+                ]
+                record_categories(record_dir, categories)
+
+                # Channels are fetched as their ids are discovered when pipelined
+                channel_recorder = recordings.enter_context(
+                    recording(record_dir, "channels")
+                )
+                fetcher = ChannelFetcher(channel_workers, channel_recorder)
+
+                # Scrape popular videos in each category, then popular videos in
+                # general, for every region. Categories are the US ones stored by
+                # init_db: they are largely shared across regions, and a category
+                # without a chart in some region just scrapes as empty there
+                charts = [
+                    (region, category_id)
+                    for region in regions
+                    for category_id in category_ids + [None]
+                ]
+                results = scrape_charts(charts, workers, record_dir, fetcher.add)
+                scrapes = [
+                    (region, category_id, videos, scrape_channel_ids)
+                    for (region, category_id), (videos, scrape_channel_ids) in zip(
+                        charts, results
+                    )
+                ]
+        else:
+            with stats.phase("replay"):
+                bulk_ingest(replay_categories(replay_path), Categories, session)
+                scrapes = [
+                    (region, category_id, *replay_videos(file))
+                    for region, category_id, file in replay_video_files(replay_path)
+                ]
+
+        with stats.phase("transform"):
+            cat_videos, pop_videos, channel_ids = [], [], set()
+            for region, category_id, videos, scrape_channel_ids in scrapes:
+                for video in videos:
+                    video["region"] = region
+                    if category_id is not None:
+                        video["scrape_type"] = (
+                            VideoType.category
+                        )  # Set scrape type for category videos
+                        video["scrape_category"] = category_id
+                    else:
+                        video["scrape_type"] = VideoType.popular  # Set scrape type for popular videos
+                        video["scrape_category"] = None  # No category for general popular videos
+                if category_id is not None:
+                    cat_videos.extend(videos)
+                else:
+                    pop_videos.extend(videos)
+                channel_ids.update(scrape_channel_ids)
+
+            videos = cat_videos + pop_videos
+
+            # Deduplicate videos based on unique constraints
+            seen_videos = set()
+            unique_videos = []
+            for video in videos:
+                key = (
+                    video["video_id"],
+                    video["scrape_type"],
+                    video["scrape_category"],
+                    video["region"],
+                )
+                if key not in seen_videos:
+                    seen_videos.add(key)
+                    unique_videos.append(video)
+
+        stats.update(
+            {
+                "charts": len(scrapes),
+                "category_videos": len(cat_videos),
+                "popular_videos": len(pop_videos),
+                "videos": len(unique_videos),
+            }
+        )
+        logger.info(
+            "Videos scraped",
+            extra={
+                "channels": len(channel_ids),
+                "category_videos": len(cat_videos),
+                "popular_videos": len(pop_videos),
+            },
         )
 
-        channels = get_channel_data(channel_ids)
+        if replay_path is None:
+            with stats.phase("channel_fetch"):
+                # Only keep channels of videos from scrapes that succeeded
+                channels = [
+                    channel
+                    for channel in fetcher.result()
+                    if channel["channel_id"] in channel_ids
+                ]
+            recordings.close()
+            log_api_metrics(stats)
+            log_etag_metrics(stats)
+        else:
+            channels = replay_channels(replay_path, unique_videos)
         
         # Deduplicate channels by channel_id to prevent primary key violations
         seen_channels = set()
@@ -61,92 +315,96 @@ def ingest_data():
             if channel["channel_id"] not in seen_channels:
                 seen_channels.add(channel["channel_id"])
                 unique_channels.append(channel)
-        
-        # Ingest channel data
-        ingest_table(unique_channels, Channels, session)
-        print("Channels ingested successfully.")
-
-        # Ingest videos
-        ingest_table(unique_videos, VideoData, session)
-        print("Videos ingested successfully.")
-
-        # Insert channel averages and popular counts
-        # Subquery for unique videos by unique id and channel id
-        unique_videos = (
-            select(
-                VideoData.channel_id,
-                VideoData.video_id,
-                VideoData.like_count,
-                VideoData.comment_count,
-                VideoData.view_count,
+        stats.count("channels", len(unique_channels))
+
+        if not incremental:
+            with stats.phase("move_old_data"):
+                # In the transaction that loads the new rows, so a run that
+                # fails before its commit leaves the previous scrape live
+                moved_videos, moved_channels = move_old_data(session)
+            stats.update(
+                {"history_videos": moved_videos, "history_channels": moved_channels}
             )
-            .distinct(VideoData.channel_id, VideoData.video_id)
-            .subquery()
-        )
 
-        total_likes = (
-            select(func.sum(unique_videos.c.like_count))
-            .where(unique_videos.c.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
-        total_comments = (
-            select(func.sum(unique_videos.c.comment_count))
-            .where(unique_videos.c.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
-        total_views = (
-            select(func.sum(unique_videos.c.view_count))
-            .where(unique_videos.c.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
-        avg_views = (
-            select(func.avg(unique_videos.c.view_count))
-            .where(unique_videos.c.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
-        avg_likes = (
-            select(func.avg(unique_videos.c.like_count))
-            .where(unique_videos.c.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
-        avg_comments = (
-            select(func.avg(unique_videos.c.comment_count))
-            .where(unique_videos.c.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
-        popular_count = (
-            select(func.count(distinct(VideoData.video_id)))
-            .where(VideoData.channel_id == Channels.channel_id)
-            .correlate(Channels)
-            .scalar_subquery()
-        )
+        with stats.phase("insert"):
+            if incremental:
+                # Channels unchanged since the last run need no write at all
+                changed_channels, skipped = split_unchanged_channels(
+                    session, unique_channels
+                )
+                channel_stats = upsert_table(changed_channels, Channels, session)
+                channel_stats["unchanged"] += skipped
+                video_stats = upsert_table(unique_videos, VideoData, session)
+                # Videos first, as they reference channels
+                stale_videos = delete_stale(unique_videos, VideoData, session)
+                stale_channels = delete_stale(unique_channels, Channels, session)
+                for prefix, table_stats, stale in (
+                    ("videos", video_stats, stale_videos),
+                    ("channels", channel_stats, stale_channels),
+                ):
+                    for name in ("inserted", "updated", "unchanged"):
+                        stats.count(f"{prefix}_{name}", table_stats[name])
+                    stats.count(f"{prefix}_deleted", stale)
+            else:
+                # Ingest channel data, then videos
+                ingest_table(unique_channels, Channels, session)
+                ingest_table(unique_videos, VideoData, session)
 
-        # Update channel averages and popular counts
-        session.execute(
-            update(Channels)
-            .values(
-                like_count=total_likes,
-                comment_count=total_comments,
-                popular_view_count=total_views,
-                average_views=avg_views,
-                average_likes=avg_likes,
-                average_comments=avg_comments,
-                popular_count=popular_count,
-            )
-            .where(Channels.channel_id == VideoData.channel_id)
-        )
+        with stats.phase("aggregate"):
+            # Insert channel averages and popular counts
+            refresh_channel_aggregates(session)
+
+        if incremental:
+            with stats.phase("history"):
+                # Record changed rows once channel aggregates are up to date
+                stats.count(
+                    "history_videos",
+                    append_history(session, VideoData, video_stats["changed"]),
+                )
+                stats.count(
+                    "history_channels",
+                    append_history(session, Channels, channel_stats["changed"]),
+                )
+
+        with stats.phase("rollups"):
+            # Fold the new history window into the daily trend rollups
+            refresh_rollups(session)
+
+        with stats.phase("leaderboards"):
+            # Rank the new live data so API reads never have to sort it
+            refresh_leaderboards(session)
 
-        session.commit()
-        print("Data ingested successfully.")
+        with stats.phase("commit"):
+            if replay_path is None:
+                etag_cache.save(session)
+            bump_generation(session)
+            session.commit()
+        status = "success"
+        log_pool_metrics(stats)
+    except IngestLocked:
+        status = "skipped"
+        logger.warning("Another ingest is running, skipping this run")
+    except QuotaBudgetExceeded as e:
+        session.rollback()
+        error = f"Quota budget exceeded: {e}"
+        log_api_metrics(stats)
+        logger.error("Ingest stopped by the API quota budget", extra={"error": str(e)})
     except Exception as e:
         session.rollback()
-        print(f"Error ingesting data: {e}")
+        error = str(e)
+        logger.exception("Error ingesting data")
     finally:
+        recordings.close()
+        try:
+            save_ingest_run(
+                session, stats, status, mode, replay_path or "api", error
+            )
+        except Exception:
+            session.rollback()
+            logger.exception("Error saving ingest run")
         session.close()
-        print("Session closed.")
+        lock.close()
+
+    summary = {"status": status, **stats.summary()}
+    logger.info("Ingest run finished", extra=summary)
+    return summary
@@ -0,0 +1,129 @@
+# Structured logging and run instrumentation.
+# Modules log through logging.getLogger(__name__) and pass structured fields
+# with `extra`; configure_logging() renders them as one JSON object per line
+# (or key=value pairs in text mode). RunStats collects per-phase timings and
+# counters for one ingest run.
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from src import log_format, log_level
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has, anything else was passed through `extra`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def record_fields(record):
+    """
+    Return the structured fields attached to a log record.
+    """
+    return {
+        key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as single-line JSON objects.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Format records as plain text followed by their fields as key=value pairs.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging(level=log_level, fmt=log_format):
+    """
+    Send all logs to stderr at the given level in JSON or text format.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # The API client logs a warning on every build() without an oauth2client cache
+    logging.getLogger("googleapiclient.discovery_cache").setLevel(logging.ERROR)
+
+
+class RunStats:
+    """
+    Wall-clock time per phase and named counters for one ingest run.
+    Safe to update from scraping threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block and add it to the named phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            logger.info(
+                "Phase finished", extra={"phase": name, "seconds": round(elapsed, 4)}
+            )
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def update(self, counters):
+        """
+        Add several counters at once, e.g. the stats returned by upsert_table.
+        """
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def duration(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        with self.lock:
+            return {
+                "duration": round(self.duration(), 4),
+                "phases": {name: round(value, 4) for name, value in self.phases.items()},
+                "counters": dict(self.counters),
+            }
@@ -0,0 +1,198 @@
+# Record raw YouTube API responses during a live scrape and replay them later,
+# so ingest can be re-run and benchmarked without network access or quota.
+#
+# A recording is a directory of JSON arrays of raw API items:
+#   videos_<region>_<category_id>.json  most popular videos in a category
+#   videos_<region>_popular.json        general most popular chart
+#   channels.json              channel items for the videos above
+#   categories.json            categories the videos were scraped under
+# Video files without a region (videos_<category_id>.json) are replayed as US,
+# and any other JSON file (such as popular_videos.json) as the US popular chart.
+
+import json
+import logging
+import os
+import threading
+from contextlib import nullcontext
+
+from src.core.api import normalise_channel, normalise_video
+
+logger = logging.getLogger(__name__)
+
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """
+    Yield the elements of a top-level JSON array one at a time, reading the
+    file in chunks so large dumps are never fully loaded.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            # Skip separators between elements
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # A value ending at the buffer edge may have been cut short
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+class Recording:
+    """
+    Write raw API items to a JSON array file as they arrive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()  # Channel batches are written from workers
+
+    def __enter__(self):
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write("[")
+        return self
+
+    def write(self, item):
+        with self._lock:
+            if self.count:
+                self._file.write(",\n")
+            json.dump(item, self._file)
+            self.count += 1
+
+    def __exit__(self, *exc):
+        self._file.write("]\n")
+        self._file.close()
+
+
+def recording(record_dir, name):
+    """
+    Return a Recording for the named file, or a no-op context when not recording.
+    """
+    if record_dir is None:
+        return nullcontext()
+    os.makedirs(record_dir, exist_ok=True)
+    return Recording(os.path.join(record_dir, f"{name}.json"))
+
+
+def video_file_name(region, category_id):
+    return f"videos_{region}_{category_id if category_id is not None else 'popular'}"
+
+
+def record_categories(record_dir, categories):
+    """
+    Save the categories a live run scraped so a replay can recreate them.
+    """
+    if record_dir is None:
+        return
+    with recording(record_dir, "categories") as recorder:
+        for category in categories:
+            recorder.write(
+                {
+                    "id": str(category.category_id),
+                    "snippet": {
+                        "title": category.name,
+                        "assignable": category.assignable,
+                    },
+                }
+            )
+
+
+def replay_video_files(path, default_region="US"):
+    """
+    Return (region, category_id, file) triples to replay, in the order a live
+    run scrapes: by region, then categories by id, then the popular chart.
+    """
+    if os.path.isfile(path):
+        return [(default_region, None, path)]
+
+    charts = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".json") or name.startswith(("channels", "categories")):
+            continue
+        region, label = default_region, None
+        if name.startswith("videos_"):
+            parts = name[len("videos_") : -len(".json")].split("_")
+            if len(parts) == 2:
+                region, label = parts
+            elif len(parts) == 1:
+                label = parts[0]
+        # Popular charts sort after every category of their region
+        category_id = int(label) if label and label.isdigit() else None
+        charts.append((region, category_id is None, category_id or 0, category_id, name))
+    return [
+        (region, category_id, os.path.join(path, name))
+        for region, _, _, category_id, name in sorted(charts)
+    ]
+
+
+def replay_videos(file):
+    """
+    Stream a saved video dump through the same normalisation as scrape_data.
+    Returns the videos, ranked by position, and their channel ids.
+    """
+    videos, channel_ids = [], set()
+    for rank, video in enumerate(iter_json_array(file), start=1):
+        row = normalise_video(video)
+        if row.get("channel_id"):
+            channel_ids.add(row["channel_id"])
+        row["rank"] = rank
+        videos.append(row)
+    return videos, list(channel_ids)
+
+
+def replay_channels(path, videos):
+    """
+    Load saved channel items, or build stubs from the videos' snippets when the
+    dump has no channel data (e.g. a bare videos.list response).
+    """
+    file = os.path.join(path, "channels.json") if os.path.isdir(path) else None
+    if file and os.path.exists(file):
+        return [normalise_channel(channel) for channel in iter_json_array(file)]
+
+    logger.info("No channels.json found, using channel stubs from video snippets")
+    stubs = {}
+    for video in videos:
+        channel_id = video.get("channel_id")
+        if channel_id and channel_id not in stubs:
+            stubs[channel_id] = {
+                "channel_id": channel_id,
+                "title": (video.get("channel_title") or channel_id)[:50],
+                # Channel creation date is not in the dump, so use the video's
+                "published_at": video.get("published_at"),
+            }
+    return list(stubs.values())
+
+
+def replay_categories(path):
+    """
+    Return saved category rows, if the recording has any.
+    """
+    file = os.path.join(path, "categories.json") if os.path.isdir(path) else None
+    if not file or not os.path.exists(file):
+        return []
+    return [
+        {
+            "category_id": int(category["id"]),
+            "name": category["snippet"]["title"],
+            "assignable": category["snippet"]["assignable"],
+        }
+        for category in iter_json_array(file)
+    ]
@@ -0,0 +1,176 @@
+# Central scheduler for YouTube API requests: a token bucket rate limit,
+# a per-run quota budget and jittered exponential retry of transient errors.
+# It is thread-safe, so the scrape and channel worker pools share one instance.
+
+import random
+import threading
+import time
+from collections import deque
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# 403 reasons that mean "slow down" rather than "not allowed"
+RETRYABLE_403_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class QuotaBudgetExceeded(Exception):
+    """
+    Raised instead of sending a request that would overspend the run's quota.
+    """
+
+
+class TokenBucket:
+    """
+    Allow `rate` acquisitions per second on average, with bursts of `burst`.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available, then take it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_not_modified(error):
+    """
+    Return whether a request failed only because a conditional request found
+    the resource unchanged.
+    """
+    return isinstance(error, HttpError) and error.resp.status == 304
+
+
+def is_retryable(error):
+    """
+    Return whether a failed request is worth retrying.
+    """
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 403:
+            content = error.content.decode(errors="replace") if error.content else ""
+            return any(reason in content for reason in RETRYABLE_403_REASONS)
+        return status in RETRYABLE_STATUSES
+    # Connection resets, timeouts and other transport errors
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+
+class RequestScheduler:
+    """
+    Execute API requests under a rate limit and quota budget, retrying
+    transient failures with full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        rate=10.0,
+        burst=10,
+        quota_budget=10000,
+        max_retries=5,
+        backoff_base=1.0,
+        backoff_max=32.0,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.quota_budget = quota_budget
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.start_run()
+
+    def start_run(self):
+        """
+        Reset the quota budget and metrics for a new ingest run.
+        """
+        with self._lock:
+            self.quota_spent = 0
+            self.requests = 0
+            self.retries = 0
+            self.failures = 0
+            self.not_modified = 0
+            self.latencies = deque(maxlen=10000)
+
+    def _reserve(self, cost):
+        with self._lock:
+            if self.quota_spent + cost > self.quota_budget:
+                raise QuotaBudgetExceeded(
+                    f"Request would exceed the quota budget of {self.quota_budget} units"
+                )
+            self.quota_spent += cost
+            self.requests += 1
+
+    def backoff(self, attempt):
+        """
+        Full-jitter delay before the given retry attempt (0-based).
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def execute(self, request, cost=1, http=None):
+        """
+        Execute a googleapiclient request, returning its response.
+        Every attempt is charged `cost` quota units, as the API charges failures too.
+        A 304 answer to a conditional request is raised as is, not retried.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._reserve(cost)
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = request.execute(http=http)
+            except Exception as e:
+                if is_not_modified(e):
+                    with self._lock:
+                        self.not_modified += 1
+                        self.latencies.append(time.perf_counter() - start)
+                    raise
+                if attempt == self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff(attempt))
+            else:
+                with self._lock:
+                    self.latencies.append(time.perf_counter() - start)
+                return response
+
+    def metrics(self):
+        """
+        Return request counts, quota spent and latency percentiles in seconds.
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            metrics = {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "not_modified": self.not_modified,
+                "quota_spent": self.quota_spent,
+                "quota_budget": self.quota_budget,
+            }
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            metrics[f"latency_{name}"] = (
+                latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+                if latencies
+                else None
+            )
+        return metrics
@@ -1,171 +1,479 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+
 import isodate
-from sqlalchemy import create_engine, delete, insert
+from sqlalchemy import (
+    UniqueConstraint,
+    delete,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import sessionmaker
 
 # Load environment variables from source
-from src import database_url
-from src.database.models import ChannelHistory, Channels, VideoData, VideoHistory
+from src import (
+    api_db_max_overflow,
+    api_db_pool_size,
+    api_db_statement_timeout,
+    history_delta_days,
+    ingest_db_max_overflow,
+    ingest_db_pool_size,
+    ingest_db_statement_timeout,
+)
+from src.database.engine import make_engine
+from src.database.models import (
+    ChannelHistory,
+    Channels,
+    IngestRun,
+    IngestState,
+    VideoData,
+    VideoHistory,
+)
+
+logger = logging.getLogger(__name__)
 
-engine = create_engine(database_url, echo=True)
+# Engine for ingest, the CLI and maintenance commands
+engine = make_engine(
+    ingest_db_pool_size, ingest_db_max_overflow, ingest_db_statement_timeout
+)
+# Engine for the API workers
+api_engine = make_engine(api_db_pool_size, api_db_max_overflow, api_db_statement_timeout)
 
-# Create session
+# Create sessions
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+ApiSessionLocal = sessionmaker(bind=api_engine, expire_on_commit=False)
+
+# Advisory lock key held by the ingest running against this database
+INGEST_LOCK_KEY = 0x59545F494E474553
+
+
+VIDEO_HISTORY_FIELDS = [
+    "video_id",
+    "scraped_at",
+    "title",
+    "description",
+    "published_at",
+    "view_count",
+    "like_count",
+    "comment_count",
+    "duration",
+    "tags",
+    "tag_list",
+    "search_vector",
+    "rank",
+    "scrape_type",
+    "scrape_category",
+    "region",
+    "channel_id",
+    "category_id",
+]
+VIDEO_DELTA_FIELDS = [
+    "view_count",
+    "like_count",
+    "comment_count",
+]  # Field for deltas
+
+CHANNEL_HISTORY_FIELDS = [
+    "channel_id",
+    "scraped_at",
+    "title",
+    "description",
+    "published_at",
+    "view_count",
+    "popular_view_count",
+    "average_views",
+    "like_count",
+    "comment_count",
+    "average_comments",
+    "subscriber_count",
+    "video_count",
+]
+CHANNEL_DELTA_FIELDS = [
+    "view_count",
+    "popular_view_count",
+    "average_views",
+    "like_count",
+    "comment_count",
+    "average_comments",
+    "subscriber_count",
+    "video_count",
+]
 
+# Live table -> (history table, entity id, copied fields, delta fields)
+HISTORY_TABLES = {
+    VideoData: (VideoHistory, "video_id", VIDEO_HISTORY_FIELDS, VIDEO_DELTA_FIELDS),
+    Channels: (
+        ChannelHistory,
+        "channel_id",
+        CHANNEL_HISTORY_FIELDS,
+        CHANNEL_DELTA_FIELDS,
+    ),
+}
 
-def safe_delta(current, previous):
+# Columns computed from other tables after ingest rather than scraped from the API
+DERIVED_COLUMNS = {
+    Channels: {
+        "popular_view_count",
+        "average_views",
+        "popular_count",
+        "like_count",
+        "comment_count",
+        "average_likes",
+        "average_comments",
+    },
+}
+
+
+def insert_history(session, table_class, where=None):
     """
-    Calculate the delta between current and previous values safely.
-    Returns None if either value is None.
+    Copy live rows into their history table with a single INSERT ... SELECT.
+    Deltas are computed on the server against the latest previous snapshot of
+    each entity, found by a LATERAL ... LIMIT 1 probe of the (entity id,
+    scraped_at DESC) index, so only one history row per entity and partition
+    is read. The probe only looks back history_delta_days, so it is pruned to
+    the recent partitions; an entity last seen before that gets NULL deltas.
+    Returns the number of history rows written.
     """
-    if current is None or previous is None:
-        return None
-    return current - previous
+    history_class, key, fields, delta_fields = HISTORY_TABLES[table_class]
+    history = history_class.__table__
+
+    current = select(table_class.__table__)
+    if where is not None:
+        current = current.where(where)
+    current = current.subquery("current")
+
+    prev = (
+        select(*(history.c[field] for field in delta_fields))
+        .where(
+            history.c[key] == current.c[key],
+            history.c.scraped_at >= func.now() - timedelta(days=history_delta_days),
+        )
+        .order_by(history.c.scraped_at.desc())
+        .limit(1)
+        .lateral("prev")
+    )
+
+    columns = [current.c[field] for field in fields]
+    # NULL without a previous snapshot or count, so it is not mistaken for no change
+    columns += [current.c[field] - prev.c[field] for field in delta_fields]
+
+    rows = select(*columns).select_from(current.outerjoin(prev, true()))
+    result = session.execute(
+        insert(history).from_select(
+            fields + [f"{field}_delta" for field in delta_fields], rows
+        )
+    )
+    return result.rowcount
 
 
 def move_old_data(session):
     """
     Move old data to history tables.
+    Nothing is committed: the caller commits the move together with the new
+    rows, so the live tables are never left empty.
+    Returns the number of video and channel rows moved.
+    """
+    videos = insert_history(session, VideoData)
+    channels = insert_history(session, Channels)
+    session.execute(delete(VideoData))
+    session.execute(delete(Channels))
+    logger.info(
+        "Old data moved to history tables",
+        extra={"videos": videos, "channels": channels},
+    )
+    return videos, channels
+
+
+def append_history(session, table_class, keys):
+    """
+    Copy the live rows with the given primary keys into their history table.
+    Used by incremental ingest, which only records rows that changed.
+    """
+    if not keys:
+        return 0
+    pk = table_class.__table__.primary_key.columns.values()[0]
+    return insert_history(session, table_class, where=pk.in_(keys))
+
+
+def channel_aggregates_statement():
     """
-    try:
-        current_videos = session.query(VideoData).all()
-        video_ids = [v.video_id for v in current_videos]
-        current_channels = session.query(Channels).all()
-        channel_ids = [
-            c.channel_id for c in current_channels
-        ] 
-
-        # Query history tables for all rows that have matching ids
-        prev_vid_histories = (
-            session.query(VideoHistory)
-            .filter(VideoHistory.video_id.in_(video_ids))
-            .order_by(VideoHistory.video_id, VideoHistory.scraped_at.asc())
-            .all()
+    Build the UPDATE that refreshes channel totals, averages and popular counts
+    from the live video table in a single aggregation pass.
+    """
+    # Unique videos by video id and channel id
+    unique_videos = (
+        select(
+            VideoData.channel_id,
+            VideoData.video_id,
+            VideoData.like_count,
+            VideoData.comment_count,
+            VideoData.view_count,
+        )
+        .distinct(VideoData.channel_id, VideoData.video_id)
+        .cte("unique_videos")
+    )
+    totals = (
+        select(
+            unique_videos.c.channel_id,
+            func.sum(unique_videos.c.like_count).label("like_count"),
+            func.sum(unique_videos.c.comment_count).label("comment_count"),
+            func.sum(unique_videos.c.view_count).label("view_count"),
+            func.avg(unique_videos.c.view_count).label("average_views"),
+            func.avg(unique_videos.c.like_count).label("average_likes"),
+            func.avg(unique_videos.c.comment_count).label("average_comments"),
+            func.count(unique_videos.c.video_id).label("popular_count"),
         )
-        prev_channel_histories = (
-            session.query(ChannelHistory)
-            .filter(ChannelHistory.channel_id.in_(channel_ids))
-            .order_by(ChannelHistory.channel_id, ChannelHistory.scraped_at.asc())
-            .all()
+        .group_by(unique_videos.c.channel_id)
+        .cte("channel_totals")
+    )
+    return (
+        update(Channels)
+        .values(
+            like_count=totals.c.like_count,
+            comment_count=totals.c.comment_count,
+            popular_view_count=totals.c.view_count,
+            average_views=totals.c.average_views,
+            average_likes=totals.c.average_likes,
+            average_comments=totals.c.average_comments,
+            popular_count=totals.c.popular_count,
         )
+        .where(Channels.channel_id == totals.c.channel_id)
+    )
+
+
+def refresh_channel_aggregates(session):
+    """
+    Update channel averages and popular counts from the current video data.
+    """
+    result = session.execute(channel_aggregates_statement())
+    logger.info("Refreshed channel aggregates", extra={"channels": result.rowcount})
+    return result.rowcount
+
+
+def bump_generation(session):
+    """
+    Increment the ingest generation as part of the current transaction.
+    Readers key their caches on it, so it must only change with committed data.
+    """
+    stmt = pg_insert(IngestState).values(id=1, generation=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IngestState.id],
+        set_={"generation": IngestState.generation + 1, "updated_at": func.now()},
+    ).returning(IngestState.generation)
+    return session.execute(stmt).scalar_one()
+
 
-        # Mapping of any scraped to their previous history, if it exists
-        # Only keeps most recent history, from ascending order
-        prev_map_vid = {h.video_id: h for h in prev_vid_histories}
-        prev_map_channel = {h.channel_id: h for h in prev_channel_histories}
-
-        video_fields = [
-            "video_id",
-            "scraped_at",
-            "title",
-            "description",
-            "published_at",
-            "view_count",
-            "like_count",
-            "comment_count",
-            "duration",
-            "tags",
-            "rank",
-            "scrape_type",
-            "channel_id",
-            "category_id",
-        ]
-        video_delta_fields = [
-            "view_count",
-            "like_count",
-            "comment_count",
-        ]  # Field for deltas
-
-        channel_fields = [
-            "channel_id",
-            "scraped_at",
-            "title",
-            "description",
-            "published_at",
-            "view_count",
-            "popular_view_count",
-            "average_views",
-            "like_count",
-            "comment_count",
-            "average_comments",
-            "subscriber_count",
-            "video_count",
-        ]
-        channel_delta_fields = [
-            "view_count",
-            "popular_view_count",
-            "average_views",
-            "like_count",
-            "comment_count",
-            "average_comments",
-            "subscriber_count",
-            "video_count",
-        ]
-
-        v_history = []
-        for video in current_videos:
-            prev = prev_map_vid.get(
-                video.video_id
-            )  # Previous video history, if it exists
-            entry = {
-                field: getattr(video, field) for field in video_fields
-            }  # dictionary of current video's keys and values
-            for field in video_delta_fields:
-                prev_val = getattr(prev, field) if prev else None
-                entry[f"{field}_delta"] = safe_delta(
-                    entry[field], prev_val
-                )  
-            v_history.append(entry)
-        c_history = []
-        for channel in current_channels:
-            prev = prev_map_channel.get(channel.channel_id)
-            entry = {field: getattr(channel, field) for field in channel_fields}
-            for field in channel_delta_fields:
-                prev_val = getattr(prev, field) if prev else None
-                entry[f"{field}_delta"] = safe_delta(entry[field], prev_val)
-            c_history.append(entry)
-
-        session.execute(insert(VideoHistory), v_history)
-        session.execute(insert(ChannelHistory), c_history)
-        session.execute(delete(VideoData))
-        session.execute(delete(Channels))
-        session.commit() 
-        print("Old video data moved to history table.")
-    except Exception as e:
-        session.rollback()
-        print(f"Error moving old video data: {e}")
-        raise  
-
-
-
-def add_record(item, table_class, session, table_cols):
-    """
-    Add record to table.
-    """
-    new_row = table_class()
-    for key in item:
-        if key in table_cols:
-            # Unnested attributes directly set
-            if key == "tags":
-                print(f"DEBUG: Setting tags directly: {item[key]}")
-            setattr(new_row, key, item[key])
-        # Handle nested attributes, nothing significant past second level
-        else:
-            if isinstance(item[key], dict):
-                for sub_key in item[key]:
-                    if sub_key in table_cols:
-                        if sub_key == "duration":
-                            setattr(
-                                new_row,
-                                sub_key,
-                                isodate.parse_duration(item[key][sub_key]),
-                            )
-                        elif sub_key == "tags":
-                            print(f"DEBUG: Setting nested tags: {item[key][sub_key]}")
-                            setattr(new_row, sub_key, item[key][sub_key])
-                        else:
-                            setattr(new_row, sub_key, item[key][sub_key])
-    # Add to session
-    session.add(new_row)
+def current_generation(session):
+    """
+    Return the latest committed ingest generation, 0 before the first ingest.
+    """
+    generation = session.scalar(select(IngestState.generation).where(IngestState.id == 1))
+    return generation or 0
+
+
+@contextmanager
+def ingest_lock():
+    """
+    Hold the ingest advisory lock for the duration of the block, yielding
+    False without waiting if another ingest already holds it.
+    The lock is taken on a connection of its own so it spans the commits made
+    during a run, and the server releases it if the process dies.
+    """
+    with engine.connect() as connection:
+        locked = connection.scalar(select(func.pg_try_advisory_lock(INGEST_LOCK_KEY)))
+        try:
+            yield locked
+        finally:
+            if locked:
+                connection.scalar(select(func.pg_advisory_unlock(INGEST_LOCK_KEY)))
+
+
+@lru_cache(maxsize=None)
+def column_map(table_class):
+    """
+    Precompute the columns a bulk row for this table is aligned to.
+    Autoincrement keys, server-defaulted and generated columns are left to
+    the database.
+    """
+    return tuple(
+        col.name
+        for col in table_class.__table__.columns
+        if col.autoincrement is not True
+        and col.server_default is None
+        and col.computed is None
+    )
+
+
+# Columns that need converting from their API representation
+COLUMN_CONVERTERS = {
+    "duration": isodate.parse_duration,
+}
+
+
+def flatten_item(item, columns):
+    """
+    Flatten a (possibly nested) API dict into a row aligned to the given columns.
+    Top-level keys win, then keys one level down; nothing deeper is used.
+    """
+    row = dict.fromkeys(columns)
+    for key, value in item.items():
+        if key in row:
+            row[key] = value
+        elif isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                if sub_key in row:
+                    row[sub_key] = sub_value
+    for key, converter in COLUMN_CONVERTERS.items():
+        if row.get(key) is not None:
+            row[key] = converter(row[key])
+    return row
+
+
+def natural_key(table_class):
+    """
+    Return the columns identifying a row across scrapes: the columns of a named
+    unique constraint, falling back to the primary key.
+    """
+    for constraint in table_class.__table__.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.name:
+            return tuple(col.name for col in constraint.columns)
+    return tuple(col.name for col in table_class.__table__.primary_key.columns)
+
+
+def conflict_target(table_class):
+    """
+    Return the natural key of a table as on_conflict keyword arguments.
+    Postgres infers the unique constraint or primary key from its columns.
+    """
+    return {"index_elements": list(natural_key(table_class))}
+
+
+def bulk_ingest(data_list, table_class, session, batch_size=1000):
+    """
+    Insert a list of API dicts into a table with batched INSERT ... ON CONFLICT.
+    Rows colliding with an existing natural key are skipped.
+    Returns the number of rows sent to the database.
+    """
+    start = time.perf_counter()
+    columns = column_map(table_class)
+    rows = [flatten_item(item, columns) for item in data_list]
+
+    stmt = pg_insert(table_class).on_conflict_do_nothing(
+        **conflict_target(table_class)
+    )
+    for i in range(0, len(rows), batch_size):
+        session.execute(stmt, rows[i : i + batch_size])
+
+    elapsed = time.perf_counter() - start
+    rate = len(rows) / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        "Rows ingested",
+        extra={
+            "table": table_class.__tablename__,
+            "rows": len(rows),
+            "seconds": round(elapsed, 4),
+            "rows_per_second": round(rate),
+        },
+    )
+    return len(rows)
+
+
+def upsert_table(data_list, table_class, session, batch_size=1000):
+    """
+    Insert or update a list of API dicts on the table's natural key.
+    Rows whose scraped columns are unchanged are left untouched, so only real
+    changes are written. Derived columns are never overwritten.
+    Returns the inserted/updated/unchanged counts and the primary keys of
+    every inserted or updated row.
+    """
+    start = time.perf_counter()
+    table = table_class.__table__
+    pk = table.primary_key.columns.values()[0]
+    columns = column_map(table_class)
+    rows = [flatten_item(item, columns) for item in data_list]
+
+    key = natural_key(table_class)
+    derived = DERIVED_COLUMNS.get(table_class, set())
+    tracked = [col for col in columns if col not in key and col not in derived]
+
+    stmt = pg_insert(table)
+    update_values = {col: stmt.excluded[col] for col in tracked}
+    if "scraped_at" in table.c:
+        update_values["scraped_at"] = func.now()
+    stmt = stmt.on_conflict_do_update(
+        **conflict_target(table_class),
+        set_=update_values,
+        where=or_(*(table.c[col].is_distinct_from(stmt.excluded[col]) for col in tracked)),
+    ).returning(pk, literal_column("xmax = 0").label("inserted"))
+
+    changed, inserted = [], 0
+    for i in range(0, len(rows), batch_size):
+        for changed_pk, was_inserted in session.execute(stmt, rows[i : i + batch_size]):
+            changed.append(changed_pk)
+            inserted += was_inserted
+
+    stats = {
+        "inserted": inserted,
+        "updated": len(changed) - inserted,
+        "unchanged": len(rows) - len(changed),
+        "changed": changed,
+    }
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Rows upserted",
+        extra={
+            "table": table_class.__tablename__,
+            "rows": len(rows),
+            "seconds": round(elapsed, 4),
+            "inserted": stats["inserted"],
+            "updated": stats["updated"],
+            "unchanged": stats["unchanged"],
+        },
+    )
+    return stats
+
+
+def delete_stale(data_list, table_class, session):
+    """
+    Delete live rows whose natural key was not part of this scrape.
+    Their last state is already in the history table.
+    """
+    key = natural_key(table_class)
+    pk = table_class.__table__.primary_key.columns.values()[0]
+    key_cols = [table_class.__table__.c[col] for col in key]
+    scraped = {tuple(item.get(col) for col in key) for item in data_list}
+
+    # Live tables only hold the current scrape, so their keys fit in memory
+    existing = session.execute(select(pk, *key_cols)).all()
+    stale = [row[0] for row in existing if tuple(row[1:]) not in scraped]
+    if stale:
+        session.execute(delete(table_class).where(pk.in_(stale)))
+    logger.info(
+        "Stale rows removed",
+        extra={"table": table_class.__tablename__, "rows": len(stale)},
+    )
+    return len(stale)
+
+
+def existing_keys(session, table_class, keys):
+    """
+    Return which of the given primary keys have a live row in the table.
+    """
+    pk = table_class.__table__.primary_key.columns.values()[0]
+    keys = list(keys)
+    existing = set()
+    for i in range(0, len(keys), 1000):
+        existing.update(session.scalars(select(pk).where(pk.in_(keys[i : i + 1000]))))
+    return existing
 
 
 def ingest_table(data_list, table_class, session):
@@ -173,17 +481,25 @@ def ingest_table(data_list, table_class, session):
     Given a list of data, the target table, and current SQLAlchemy session,
     this function will ingest the data into the database.
     """
-    # Get list of attributes for the table
-    table_cols = {col.name for col in table_class.__table__.columns}
-
-    for item in data_list:
-        p_k_fields = [
-            col.name for col in table_class.__table__.primary_key.columns
-        ]
-        p_k_args = {
-            field: item.get(field) for field in p_k_fields
-        }
-        add_record(item, table_class, session, table_cols)
-        print(
-            f"Added new {table_class.__name__} record with {p_k_fields} : {p_k_args}."
+    return bulk_ingest(data_list, table_class, session)
+
+
+def save_ingest_run(session, stats, status, mode, source, error=None):
+    """
+    Persist the summary of an ingest run to ingest_runs.
+    """
+    summary = stats.summary()
+    session.add(
+        IngestRun(
+            started_at=stats.started_at,
+            finished_at=datetime.now(),
+            status=status,
+            mode=mode,
+            source=source,
+            duration=summary["duration"],
+            phases=summary["phases"],
+            counters=summary["counters"],
+            error=error,
         )
+    )
+    session.commit()
@@ -0,0 +1,128 @@
+# Engine factory for the database connection pools.
+# Ingest and the API each get their own engine, configured from the
+# environment in src/__init__.py, and their pools record how often and how
+# long callers wait for a connection.
+
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+
+from src import (
+    database_url,
+    db_echo,
+    db_pool_pre_ping,
+    db_pool_recycle,
+    db_pool_timeout,
+)
+
+
+class PoolMetrics:
+    """
+    Thread-safe counters for connection checkouts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that times every checkout: taking an idle connection, opening a
+    new one, or waiting for one to be returned when the pool and its overflow
+    are exhausted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # Keep counting across dispose() and invalidation
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+# Engines made here, held weakly so the fork hook does not keep them alive
+_engines = weakref.WeakSet()
+
+
+def _dispose_after_fork():
+    """
+    Give every engine of a forked child a fresh pool instead of the parent's
+    sockets, which are left open for the parent.
+    """
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def make_engine(pool_size, max_overflow, statement_timeout=0, url=database_url):
+    """
+    Create an engine with a metered connection pool, safe to use after fork.
+    A statement timeout in milliseconds is set on every connection, 0 for none.
+    """
+    connect_args = {}
+    if statement_timeout:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+    engine = create_engine(
+        url,
+        echo=db_echo,
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=db_pool_timeout,
+        pool_recycle=db_pool_recycle,
+        pool_pre_ping=db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+    _engines.add(engine)
+    return engine
+
+
+def pool_metrics(engine):
+    """
+    Return checkout and wait metrics plus the current state of an engine's pool.
+    """
+    pool = engine.pool
+    metrics = pool.metrics
+    with metrics.lock:
+        checkouts = metrics.checkouts
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": checkouts,
+            "timeouts": metrics.timeouts,
+            "wait_avg": metrics.wait_total / checkouts if checkouts else None,
+            "wait_max": metrics.wait_max,
+        }
@@ -1,8 +1,16 @@
 # (Reset and) initialize the database and populate it with categories from the YouTube API.
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import AddConstraint, CreateColumn
+
 from src.core.api import get_video_categories
 from src.database.base import Base
 from src.database.database import SessionLocal, engine
-from src.database.models import Categories
+from src.database.models import Categories, VideoData
+from src.database.partitions import ensure_partitions
+
+logger = logging.getLogger(__name__)
 
 
 def reset_db():
@@ -10,7 +18,135 @@ def reset_db():
     Drop all tables in the database.
     """
     Base.metadata.drop_all(bind=engine)
-    print("Database reset")
+    logger.info("Database reset")
+
+
+# (table, old name) -> new name of columns renamed since tables were created
+RENAMED_COLUMNS = {
+    ("channel_history", "video_count_elta"): "video_count_delta",
+}
+
+
+def rename_columns():
+    """
+    Rename columns whose name changed in the models. If the new column was
+    already added alongside the old one, its missing values are copied over
+    and the old column is dropped.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for (table, old), new in RENAMED_COLUMNS.items():
+            if not inspector.has_table(table):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            if old not in existing:
+                continue
+            if new in existing:
+                connection.execute(
+                    text(f"UPDATE {table} SET {new} = {old} WHERE {new} IS NULL")
+                )
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {old}"))
+            else:
+                connection.execute(
+                    text(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}")
+                )
+            logger.info(
+                "Renamed column", extra={"table": table, "old": old, "new": new}
+            )
+
+
+def require_regions():
+    """
+    Give the video tables of databases created before multi-region scraping
+    their required region column, and region in the unique chart key. Every
+    earlier scrape read the US charts, so existing rows are marked US.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in ("video_data", "video_history"):
+            if not inspector.has_table(table):
+                continue
+            columns = {column["name"]: column for column in inspector.get_columns(table)}
+            if "region" not in columns:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table} ADD COLUMN region varchar(2) NOT NULL DEFAULT 'US'"
+                    )
+                )
+                connection.execute(
+                    text(f"ALTER TABLE {table} ALTER COLUMN region DROP DEFAULT")
+                )
+            elif columns["region"]["nullable"]:
+                connection.execute(
+                    text(f"UPDATE {table} SET region = 'US' WHERE region IS NULL")
+                )
+                connection.execute(
+                    text(f"ALTER TABLE {table} ALTER COLUMN region SET NOT NULL")
+                )
+            else:
+                continue
+            logger.info("Made region required", extra={"table": table})
+
+        if inspector.has_table("video_data"):
+            constraints = {
+                constraint["name"]: constraint["column_names"]
+                for constraint in inspector.get_unique_constraints("video_data")
+            }
+            if "region" not in constraints.get("uq_video_scrape", ["region"]):
+                connection.execute(
+                    text("ALTER TABLE video_data DROP CONSTRAINT uq_video_scrape")
+                )
+                connection.execute(
+                    AddConstraint(
+                        next(
+                            constraint
+                            for constraint in VideoData.__table__.constraints
+                            if constraint.name == "uq_video_scrape"
+                        )
+                    )
+                )
+                logger.info("Added region to uq_video_scrape")
+
+
+# (table, column) -> statement filling a column in rows written before it
+# existed, run once in the transaction that adds the column
+COLUMN_BACKFILLS = {
+    # History tags only survive as the joined string, so that is split up
+    ("video_history", "search_vector"): """
+        UPDATE video_history
+        SET search_vector = video_search_vector(
+            title, coalesce(tag_list, string_to_array(tags, ', ')), description
+        )
+    """,
+}
+
+
+def add_missing_columns():
+    """
+    Add nullable model columns missing from existing tables, and backfill
+    the ones listed in COLUMN_BACKFILLS.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                logger.info(
+                    "Added column", extra={"table": table.name, "column": column.name}
+                )
+                backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill is not None:
+                    rows = connection.execute(text(backfill)).rowcount
+                    logger.info(
+                        "Backfilled column",
+                        extra={"table": table.name, "column": column.name, "rows": rows},
+                    )
 
 
 def init_db():
@@ -19,7 +155,17 @@ def init_db():
     """
     # Create all tables in the database
     Base.metadata.create_all(bind=engine)
-    print("Database initialized and tables created.")
+    # create_all skips existing tables, so rename columns and add nullable
+    # columns and indexes introduced since
+    rename_columns()
+    require_regions()
+    add_missing_columns()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with engine.begin() as connection:
+        ensure_partitions(connection)
+    logger.info("Database initialized and tables created")
 
     session = SessionLocal()
 
@@ -40,10 +186,9 @@ def init_db():
             session.add(new_category)
         # Commit session
         session.commit()
-        print("Categories populated successfully.")
-    except Exception as e:
+        logger.info("Categories populated", extra={"categories": len(categories)})
+    except Exception:
         session.rollback()
-        print(f"Error populating categories: {e}")
+        logger.exception("Error populating categories")
     finally:
         session.close()
-        print("Session closed.")
@@ -0,0 +1,175 @@
+# Leaderboards rebuilt at the end of every ingest.
+# Rankings are computed once from the live tables and stored with their
+# position in the primary key (or, for rank movers, an index on the movement),
+# so an API request reads the first K entries of an index instead of sorting
+# channels or videos. Each table only ever holds the latest ingest, so its size
+# tracks the live tables rather than the history.
+
+import enum
+import logging
+
+from sqlalchemy import delete, func, insert, literal, select
+
+from src import leaderboard_size
+from src.database.models import (
+    CategoryVideoRank,
+    ChannelRank,
+    Channels,
+    ChartPosition,
+    VideoData,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelRankMetric(str, enum.Enum):
+    popular_count = "popular_count"
+    popular_view_count = "popular_view_count"
+    average_views = "average_views"
+    average_likes = "average_likes"
+    average_comments = "average_comments"
+    view_count = "view_count"
+    subscriber_count = "subscriber_count"
+    video_count = "video_count"
+
+
+class VideoRankMetric(str, enum.Enum):
+    view_count = "view_count"
+    like_count = "like_count"
+    comment_count = "comment_count"
+
+
+def channel_rank_rows(metric, size):
+    """
+    Select the `size` channels with the highest value of a metric, numbered
+    from 1. Channels without a value are left out.
+    """
+    value = Channels.__table__.c[metric.value]
+    return (
+        select(
+            literal(metric.value).label("metric"),
+            func.row_number()
+            .over(order_by=(value.desc(), Channels.channel_id))
+            .label("position"),
+            Channels.channel_id,
+            Channels.title,
+            value.label("value"),
+        )
+        .where(value.is_not(None))
+        .order_by(value.desc(), Channels.channel_id)
+        .limit(size)
+    )
+
+
+def category_video_rank_rows(metric, size):
+    """
+    Select the `size` videos of each category with the highest value of a
+    metric, numbered from 1 within the category. A video in several charts
+    has the same counts in each, so it is ranked once.
+    """
+    value = VideoData.__table__.c[metric.value]
+    videos = (
+        select(
+            VideoData.video_id,
+            VideoData.category_id,
+            VideoData.title,
+            VideoData.channel_id,
+            value.label("value"),
+        )
+        .where(VideoData.category_id.is_not(None), value.is_not(None))
+        .distinct(VideoData.video_id)
+        .order_by(VideoData.video_id)
+        .subquery()
+    )
+    ranked = select(
+        videos,
+        func.row_number()
+        .over(
+            partition_by=videos.c.category_id,
+            order_by=(videos.c.value.desc(), videos.c.video_id),
+        )
+        .label("position"),
+    ).subquery()
+    return select(
+        ranked.c.category_id,
+        literal(metric.value).label("metric"),
+        ranked.c.position,
+        ranked.c.video_id,
+        ranked.c.title,
+        ranked.c.channel_id,
+        ranked.c.value,
+    ).where(ranked.c.position <= size)
+
+
+def refresh_chart_positions(session):
+    """
+    Replace the stored chart positions with those of the live video table,
+    comparing each against the position it replaces in the same chart.
+    Old positions are deleted and read back in the same statement, so no
+    history has to be searched for the previous scrape.
+    """
+    previous = (
+        delete(ChartPosition)
+        .returning(
+            ChartPosition.region,
+            ChartPosition.scrape_type,
+            ChartPosition.scrape_category,
+            ChartPosition.video_id,
+            ChartPosition.rank,
+        )
+        .cte("previous")
+    )
+    rows = select(
+        VideoData.region,
+        VideoData.scrape_type,
+        VideoData.scrape_category,
+        VideoData.video_id,
+        VideoData.title,
+        VideoData.channel_id,
+        VideoData.rank,
+        previous.c.rank.label("previous_rank"),
+        (previous.c.rank - VideoData.rank).label("rank_change"),
+    ).outerjoin(
+        previous,
+        (previous.c.region == VideoData.region)
+        & (previous.c.scrape_type == VideoData.scrape_type)
+        & previous.c.scrape_category.is_not_distinct_from(VideoData.scrape_category)
+        & (previous.c.video_id == VideoData.video_id),
+    )
+    columns = [column.name for column in rows.selected_columns]
+    stmt = insert(ChartPosition).from_select(columns, rows).add_cte(previous)
+    return session.execute(stmt).rowcount
+
+
+def refresh_leaderboards(session, size=leaderboard_size):
+    """
+    Rebuild the channel and category leaderboards and the chart positions
+    from the live tables, as part of the current transaction.
+    """
+    session.execute(delete(ChannelRank))
+    channels = 0
+    for metric in ChannelRankMetric:
+        rows = channel_rank_rows(metric, size)
+        columns = [column.name for column in rows.selected_columns]
+        channels += session.execute(
+            insert(ChannelRank).from_select(columns, rows)
+        ).rowcount
+
+    session.execute(delete(CategoryVideoRank))
+    videos = 0
+    for metric in VideoRankMetric:
+        rows = category_video_rank_rows(metric, size)
+        columns = [column.name for column in rows.selected_columns]
+        videos += session.execute(
+            insert(CategoryVideoRank).from_select(columns, rows)
+        ).rowcount
+
+    positions = refresh_chart_positions(session)
+    logger.info(
+        "Refreshed leaderboards",
+        extra={
+            "channel_ranks": channels,
+            "video_ranks": videos,
+            "chart_positions": positions,
+        },
+    )
@@ -6,21 +6,48 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Computed,
+    DDL,
+    Date,
     DateTime,
     Enum,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     Interval,
     String,
     Text,
     UniqueConstraint,
+    event,
     func,
 )
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
 from sqlalchemy.orm import relationship
 
 from src.database.base import Base
 
 
+# Weighted search document of a video: title, then tags, then description.
+# Declared IMMUTABLE so generated columns can use it, which holds as the text
+# search configuration is fixed rather than taken from the session.
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL(
+        """
+        CREATE OR REPLACE FUNCTION video_search_vector(
+            title text, tags text[], description text
+        ) RETURNS tsvector LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('english', coalesce(array_to_string(tags, ' '), '')), 'B')
+                || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        $$
+        """
+    ),
+)
+
+
 class VideoType(enum.Enum):
     popular = "popular"
     category = "category"
@@ -45,6 +72,12 @@ class VideoData(Base):
     comment_count = Column(Integer, nullable=True)
     duration = Column(Interval, nullable=True)  # Stored as ISO8601 duration format
     tags = Column(Text, nullable=True)  # Store as comma-separated string for simplicity
+    tag_list = Column(ARRAY(Text), nullable=True)  # Every tag, untruncated
+    # Maintained by Postgres on every insert and update
+    search_vector = Column(
+        TSVECTOR,
+        Computed("video_search_vector(title, tag_list, description)", persisted=True),
+    )
     scrape_type = Column(
         Enum(VideoType), nullable=False
     )  # Column for scrape type, e.g., "popular", or "category"
@@ -52,6 +85,9 @@ class VideoData(Base):
         Integer, nullable=True
     )  # Category ID of scraped category for category scrape type
     rank = Column(Integer, nullable=False)  # Rank of the video at the time of scrape
+    region = Column(
+        String(2), nullable=False
+    )  # ISO 3166-1 region code of the chart the video was scraped from
     # Foreign key to channels table
     channel_id = Column(String(255), ForeignKey("channels.channel_id"))
     # Foreign key to categories table
@@ -64,9 +100,16 @@ class VideoData(Base):
 
     __table_args__ = (
         UniqueConstraint(
-            "video_id", "scrape_type", "scrape_category", name="uq_video_scrape"
+            "video_id",
+            "scrape_type",
+            "scrape_category",
+            "region",
+            name="uq_video_scrape",
+            postgresql_nulls_not_distinct=True,  # Popular videos have no category
         ),
-    )  # Ensure unique combination of video ID, scrape type, and scrape category
+        Index("ix_video_data_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_video_data_tag_list", "tag_list", postgresql_using="gin"),
+    )  # Ensure unique combination of video ID, scrape type, scrape category and region
 
 
 # Table for historical video data
@@ -75,7 +118,9 @@ class VideoHistory(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)  # Unique ID for the row
     video_id = Column(String(255), nullable=False)  # ID of the video
-    scraped_at = Column(DateTime, nullable=False)  # Timestamp of scrape
+    scraped_at = Column(
+        DateTime, primary_key=True
+    )  # Timestamp of scrape, part of the key as the table is partitioned on it
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     published_at = Column(DateTime, nullable=False)
@@ -93,12 +138,24 @@ class VideoHistory(Base):
     )  # Change in comment count since last scrape
     duration = Column(Interval, nullable=True)
     tags = Column(Text, nullable=True)
+    tag_list = Column(ARRAY(Text), nullable=True)
+    # Copied from video_data rather than generated, so moving rows to history
+    # does not parse the text again
+    search_vector = Column(TSVECTOR, nullable=True)
     rank = Column(Integer, nullable=False)  # Rank of the video at the time of scrape
     scrape_type = Column(Enum(VideoType), nullable=False)
     scrape_category = Column(Integer, nullable=True)
+    region = Column(String(2), nullable=False)  # Region of the scraped chart
     channel_id = Column(String(255), nullable=False)  # Channel ID of parent channel
     category_id = Column(Integer, nullable=True)  # Category ID of the video
 
+    __table_args__ = (
+        Index("ix_video_history_video_id_scraped_at", video_id, scraped_at.desc()),
+        Index("ix_video_history_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_video_history_tag_list", "tag_list", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (scraped_at)"},
+    )  # Monthly partitions, see partitions.py; index finds latest snapshot per video
+
 
 class Categories(Base):
     __tablename__ = "categories"
@@ -145,7 +202,9 @@ class ChannelHistory(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)  # Unique ID for the row
     channel_id = Column(String(255), nullable=False)  # ID of the channel
-    scraped_at = Column(DateTime, nullable=False)
+    scraped_at = Column(
+        DateTime, primary_key=True
+    )  # Part of the key as the table is partitioned on it
     title = Column(String(50), nullable=False)
     description = Column(Text, nullable=True)
     published_at = Column(DateTime, nullable=False)
@@ -166,6 +225,186 @@ class ChannelHistory(Base):
     subscriber_count = Column(BigInteger, nullable=True)
     subscriber_count_delta = Column(BigInteger, nullable=True)
     video_count = Column(Integer, nullable=True)
-    video_count_elta = Column(Integer, nullable=True)
+    video_count_delta = Column(Integer, nullable=True)
     popular_count = Column(Integer, nullable=True)
     popular_count_delta = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_channel_history_channel_id_scraped_at", channel_id, scraped_at.desc()
+        ),
+        {"postgresql_partition_by": "RANGE (scraped_at)"},
+    )  # Monthly partitions, see partitions.py; index finds latest snapshot per channel
+
+
+# Single-row table tracking how many ingests have committed
+class IngestState(Base):
+    __tablename__ = "ingest_state"
+
+    id = Column(Integer, primary_key=True, default=1)
+    generation = Column(
+        BigInteger, nullable=False, default=0
+    )  # Bumped by every successful ingest, used to invalidate API caches
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+    rollup_watermark = Column(
+        DateTime, nullable=True
+    )  # Latest history scraped_at folded into the daily rollups
+
+
+# Daily rollup of video history, one row per video per day
+class VideoDaily(Base):
+    __tablename__ = "video_daily"
+
+    video_id = Column(String(255), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    channel_id = Column(String(255), nullable=True)
+    category_id = Column(Integer, nullable=True)
+    view_count = Column(BigInteger, nullable=True)  # Highest count seen that day
+    like_count = Column(BigInteger, nullable=True)
+    comment_count = Column(BigInteger, nullable=True)
+    view_count_delta = Column(BigInteger, nullable=True)  # Sum of scrape deltas that day
+    like_count_delta = Column(BigInteger, nullable=True)
+    comment_count_delta = Column(BigInteger, nullable=True)
+    best_rank = Column(Integer, nullable=True)  # Best chart position that day
+    snapshots = Column(Integer, nullable=False)  # Number of scrapes the video was in
+
+
+# Daily rollup of channel history, one row per channel per day
+class ChannelDaily(Base):
+    __tablename__ = "channel_daily"
+
+    channel_id = Column(String(255), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    view_count = Column(BigInteger, nullable=True)  # Highest count seen that day
+    subscriber_count = Column(BigInteger, nullable=True)
+    popular_view_count = Column(BigInteger, nullable=True)
+    like_count = Column(BigInteger, nullable=True)  # Over the channel's trending videos
+    comment_count = Column(BigInteger, nullable=True)
+    view_count_delta = Column(BigInteger, nullable=True)  # Sum of scrape deltas that day
+    subscriber_count_delta = Column(BigInteger, nullable=True)
+    popular_view_count_delta = Column(BigInteger, nullable=True)
+    like_count_delta = Column(BigInteger, nullable=True)
+    comment_count_delta = Column(BigInteger, nullable=True)
+    snapshots = Column(Integer, nullable=False)
+
+
+# Daily rollup of videos per category, derived from VideoDaily
+class CategoryDaily(Base):
+    __tablename__ = "category_daily"
+
+    category_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    video_count = Column(Integer, nullable=False)  # Distinct trending videos that day
+    view_count = Column(BigInteger, nullable=True)
+    like_count = Column(BigInteger, nullable=True)
+    comment_count = Column(BigInteger, nullable=True)
+    view_count_delta = Column(BigInteger, nullable=True)  # View velocity for the day
+    like_count_delta = Column(BigInteger, nullable=True)
+    comment_count_delta = Column(BigInteger, nullable=True)
+
+
+# Top channels per metric, rebuilt at the end of every ingest by leaderboards.py
+class ChannelRank(Base):
+    __tablename__ = "channel_ranks"
+
+    metric = Column(String(30), primary_key=True)  # Channels column ranked by
+    position = Column(Integer, primary_key=True)  # 1 holds the highest value
+    channel_id = Column(String(255), nullable=False)
+    title = Column(String(50), nullable=True)
+    value = Column(BigInteger, nullable=True)
+
+
+# Top videos of each category per metric, rebuilt with the channel ranks
+class CategoryVideoRank(Base):
+    __tablename__ = "category_video_ranks"
+
+    category_id = Column(Integer, primary_key=True)
+    metric = Column(String(30), primary_key=True)  # VideoData column ranked by
+    position = Column(Integer, primary_key=True)
+    video_id = Column(String(255), nullable=False)
+    title = Column(String(255), nullable=True)
+    channel_id = Column(String(255), nullable=True)
+    value = Column(BigInteger, nullable=True)
+
+
+# Chart positions of the latest ingest and how far each video moved since the
+# one before, replaced at the end of every ingest
+class ChartPosition(Base):
+    __tablename__ = "chart_positions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    region = Column(String(2), nullable=False)
+    scrape_type = Column(Enum(VideoType), nullable=False)
+    scrape_category = Column(Integer, nullable=True)
+    video_id = Column(String(255), nullable=False)
+    title = Column(String(255), nullable=True)
+    channel_id = Column(String(255), nullable=True)
+    rank = Column(Integer, nullable=False)
+    previous_rank = Column(Integer, nullable=True)  # None for new entries
+    rank_change = Column(Integer, nullable=True)  # Places climbed, negative if fallen
+
+    __table_args__ = (
+        Index("ix_chart_positions_rank_change", "rank_change", "id"),
+        Index("ix_chart_positions_region_rank_change", "region", "rank_change", "id"),
+    )  # Movers are read in rank_change order, overall or per region
+
+
+# Per-snapshot metrics computed from video history by src/core/analytics.py
+class VideoMetrics(Base):
+    __tablename__ = "video_metrics"
+
+    history_id = Column(Integer, primary_key=True)  # id of the video_history row
+    scraped_at = Column(DateTime, primary_key=True)
+    video_id = Column(String(255), nullable=False, index=True)
+    rank = Column(Integer, nullable=True)
+    rank_change = Column(Integer, nullable=True)  # Places gained in the same chart
+    view_count_delta = Column(BigInteger, nullable=True)
+    like_count_delta = Column(BigInteger, nullable=True)
+    comment_count_delta = Column(BigInteger, nullable=True)
+    view_growth_rate = Column(
+        Float, nullable=True
+    )  # Relative view growth per hour since the previous snapshot
+    like_growth_rate = Column(Float, nullable=True)
+    view_delta_avg = Column(Float, nullable=True)  # Moving average of view deltas
+
+
+# Per-snapshot metrics computed from channel history by src/core/analytics.py
+class ChannelMetrics(Base):
+    __tablename__ = "channel_metrics"
+
+    history_id = Column(Integer, primary_key=True)  # id of the channel_history row
+    scraped_at = Column(DateTime, primary_key=True)
+    channel_id = Column(String(255), nullable=False, index=True)
+    view_count_delta = Column(BigInteger, nullable=True)
+    subscriber_count_delta = Column(BigInteger, nullable=True)
+    view_growth_rate = Column(Float, nullable=True)
+    subscriber_growth_rate = Column(Float, nullable=True)
+    view_delta_avg = Column(Float, nullable=True)
+    subscriber_delta_avg = Column(Float, nullable=True)
+
+
+# One row per ingest run, to track performance over time
+class IngestRun(Base):
+    __tablename__ = "ingest_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=False)
+    status = Column(String(20), nullable=False)  # "success", "failed" or "skipped"
+    mode = Column(String(20), nullable=False)  # "replace" or "incremental"
+    source = Column(String(255), nullable=False)  # "api" or the replayed path
+    duration = Column(Float, nullable=False)  # Seconds
+    phases = Column(JSONB, nullable=False)  # Phase name -> seconds
+    counters = Column(JSONB, nullable=False)  # Rows, requests, quota and so on
+    error = Column(Text, nullable=True)
+
+
+class ApiEtag(Base):
+    __tablename__ = "api_etags"
+
+    # "videos:<request parameters>", "channels:<ids>" or "channel:<id>"
+    key = Column(Text, primary_key=True)
+    etag = Column(String(255), nullable=False)
+    payload = Column(JSONB, nullable=False)  # Parsed response, or normalised row
+    size = Column(Integer, nullable=False)  # Approximate response size in bytes
+    used_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,183 @@
+# Monthly range partitions for the history tables.
+# Partitions are named <table>_yYYYYmMM and cover one calendar month of scraped_at.
+# A default partition catches anything outside them so inserts never fail,
+# but partitions should be created ahead of time so it stays empty.
+
+import logging
+from datetime import date
+
+from sqlalchemy import text
+
+from src.database.models import ChannelHistory, VideoHistory
+
+HISTORY_TABLES = [VideoHistory.__table__, ChannelHistory.__table__]
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day, offset=0):
+    """
+    Return the first day of the month `offset` months after the month of `day`.
+    """
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(table_name, start):
+    return f"{table_name}_y{start.year:04d}m{start.month:02d}"
+
+
+def existing_partitions(connection, table_name):
+    """
+    Return the names of the partitions attached to a table.
+    """
+    return set(
+        connection.execute(
+            text(
+                """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+                JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+                WHERE parent.relname = :table_name
+                """
+            ),
+            {"table_name": table_name},
+        ).scalars()
+    )
+
+
+def is_partitioned(connection, table_name):
+    return bool(
+        connection.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table JOIN pg_class "
+                "ON pg_partitioned_table.partrelid = pg_class.oid "
+                "WHERE pg_class.relname = :name"
+            ),
+            {"name": table_name},
+        ).scalar()
+    )
+
+
+def ensure_partitions(connection, months_ahead=3, start=None, tables=HISTORY_TABLES):
+    """
+    Create any missing monthly partitions from `start` (default: this month)
+    through `months_ahead` months ahead, plus the default partition.
+    Months follow the database clock, which also stamps scraped_at.
+    Existing partitions are left alone, so this is cheap to run every ingest.
+    Returns the names of the partitions created.
+    """
+    today = connection.execute(text("SELECT CAST(now() AS date)")).scalar()
+    first = month_start(start or today)
+    last = month_start(today, months_ahead)
+    created = []
+    for table in tables:
+        if not is_partitioned(connection, table.name):
+            logger.warning(
+                "Table is not partitioned, run 'main.py partitions' to convert it",
+                extra={"table": table.name},
+            )
+            continue
+        existing = existing_partitions(connection, table.name)
+        default = f"{table.name}_default"
+        if default not in existing:
+            connection.execute(
+                text(f"CREATE TABLE {default} PARTITION OF {table.name} DEFAULT")
+            )
+            created.append(default)
+        month = first
+        while month <= last:
+            name = partition_name(table.name, month)
+            if name not in existing:
+                connection.execute(
+                    text(
+                        f"CREATE TABLE {name} PARTITION OF {table.name} "
+                        f"FOR VALUES FROM ('{month}') TO ('{month_start(month, 1)}')"
+                    )
+                )
+                created.append(name)
+            month = month_start(month, 1)
+    if created:
+        logger.info("Created history partitions", extra={"partitions": created})
+    return created
+
+
+def detach_partitions(connection, cutoff, drop=False):
+    """
+    Detach (and optionally drop) every monthly partition that ends on or before
+    the cutoff date, removing its rows from the history tables.
+    Returns the names of the partitions detached.
+    """
+    detached = []
+    for table in HISTORY_TABLES:
+        prefix = f"{table.name}_y"
+        for name in sorted(existing_partitions(connection, table.name)):
+            if not name.startswith(prefix):
+                continue
+            year, month = int(name[len(prefix) : -3]), int(name[-2:])
+            if month_start(date(year, month, 1), 1) > cutoff:
+                continue
+            connection.execute(
+                text(f"ALTER TABLE {table.name} DETACH PARTITION {name}")
+            )
+            if drop:
+                connection.execute(text(f"DROP TABLE {name}"))
+            detached.append(name)
+    logger.info(
+        "Dropped history partitions" if drop else "Detached history partitions",
+        extra={"partitions": detached, "cutoff": cutoff},
+    )
+    return detached
+
+
+def partition_history(connection, months_ahead=3):
+    """
+    Convert history tables created before partitioning: the old heap table is
+    renamed, a partitioned one is created in its place with partitions covering
+    its rows, and the rows are copied across before the old table is dropped.
+    """
+    for table in HISTORY_TABLES:
+        if is_partitioned(connection, table.name):
+            continue
+        old_name = f"{table.name}_unpartitioned"
+        connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {old_name}"))
+        # Index names are schema-wide, so free them for the new table
+        for index in table.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        connection.execute(
+            text(f"ALTER SEQUENCE IF EXISTS {table.name}_id_seq RENAME TO {old_name}_id_seq")
+        )
+        table.create(bind=connection, checkfirst=True)
+
+        oldest = connection.execute(
+            text(f"SELECT min(scraped_at) FROM {old_name}")
+        ).scalar()
+        ensure_partitions(
+            connection,
+            months_ahead,
+            start=oldest.date() if oldest else None,
+            tables=[table],
+        )
+
+        # Columns added since the old table was created are left to their defaults
+        old_columns = set(
+            connection.execute(
+                text("SELECT column_name FROM information_schema.columns WHERE table_name = :name"),
+                {"name": old_name},
+            ).scalars()
+        )
+        columns = ", ".join(
+            column.name for column in table.columns if column.name in old_columns
+        )
+        copied = connection.execute(
+            text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}")
+        ).rowcount
+        connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"coalesce((SELECT max(id) FROM {table.name}), 0) + 1, false)"
+            )
+        )
+        connection.execute(text(f"DROP TABLE {old_name}"))
+        logger.info("Partitioned table", extra={"table": table.name, "rows": copied})
@@ -0,0 +1,168 @@
+# Daily trend rollups over the history tables.
+# Each refresh only recomputes the days touched by history rows newer than the
+# watermark stored in ingest_state, and upserts them, so its cost tracks the
+# size of the latest ingest rather than of the whole history.
+
+import logging
+
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src.database.models import (
+    CategoryDaily,
+    ChannelDaily,
+    ChannelHistory,
+    IngestState,
+    VideoDaily,
+    VideoHistory,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def upsert_from_select(session, table_class, rows):
+    """
+    Insert the rows of a select into a rollup table, replacing existing days.
+    """
+    columns = [column.name for column in rows.selected_columns]
+    stmt = pg_insert(table_class).from_select(columns, rows)
+    keys = [column.name for column in table_class.__table__.primary_key.columns]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: stmt.excluded[column] for column in columns if column not in keys},
+    )
+    return session.execute(stmt).rowcount
+
+
+def video_daily_rows(since):
+    """
+    Aggregate video history per video and day from `since` on.
+    A video scraped in several charts has identical counts in each, so rows are
+    first reduced to one per video and scrape to avoid counting deltas twice.
+    """
+    per_scrape = select(
+        VideoHistory.video_id,
+        VideoHistory.scraped_at,
+        VideoHistory.channel_id,
+        VideoHistory.category_id,
+        VideoHistory.view_count,
+        VideoHistory.like_count,
+        VideoHistory.comment_count,
+        VideoHistory.view_count_delta,
+        VideoHistory.like_count_delta,
+        VideoHistory.comment_count_delta,
+        func.min(VideoHistory.rank)
+        .over(partition_by=(VideoHistory.video_id, VideoHistory.scraped_at))
+        .label("best_rank"),
+    ).distinct(VideoHistory.video_id, VideoHistory.scraped_at)
+    if since is not None:
+        per_scrape = per_scrape.where(VideoHistory.scraped_at >= since)
+    per_scrape = per_scrape.order_by(
+        VideoHistory.video_id, VideoHistory.scraped_at
+    ).subquery()
+
+    day = cast(per_scrape.c.scraped_at, Date)
+    return select(
+        per_scrape.c.video_id,
+        day.label("day"),
+        func.max(per_scrape.c.channel_id).label("channel_id"),
+        func.max(per_scrape.c.category_id).label("category_id"),
+        func.max(per_scrape.c.view_count).label("view_count"),
+        func.max(per_scrape.c.like_count).label("like_count"),
+        func.max(per_scrape.c.comment_count).label("comment_count"),
+        func.sum(per_scrape.c.view_count_delta).label("view_count_delta"),
+        func.sum(per_scrape.c.like_count_delta).label("like_count_delta"),
+        func.sum(per_scrape.c.comment_count_delta).label("comment_count_delta"),
+        func.min(per_scrape.c.best_rank).label("best_rank"),
+        func.count().label("snapshots"),
+    ).group_by(per_scrape.c.video_id, day)
+
+
+def channel_daily_rows(since):
+    """
+    Aggregate channel history per channel and day from `since` on.
+    """
+    day = cast(ChannelHistory.scraped_at, Date)
+    rows = select(
+        ChannelHistory.channel_id,
+        day.label("day"),
+        func.max(ChannelHistory.view_count).label("view_count"),
+        func.max(ChannelHistory.subscriber_count).label("subscriber_count"),
+        func.max(ChannelHistory.popular_view_count).label("popular_view_count"),
+        func.max(ChannelHistory.like_count).label("like_count"),
+        func.max(ChannelHistory.comment_count).label("comment_count"),
+        func.sum(ChannelHistory.view_count_delta).label("view_count_delta"),
+        func.sum(ChannelHistory.subscriber_count_delta).label("subscriber_count_delta"),
+        func.sum(ChannelHistory.popular_view_count_delta).label(
+            "popular_view_count_delta"
+        ),
+        func.sum(ChannelHistory.like_count_delta).label("like_count_delta"),
+        func.sum(ChannelHistory.comment_count_delta).label("comment_count_delta"),
+        func.count().label("snapshots"),
+    ).group_by(ChannelHistory.channel_id, day)
+    if since is not None:
+        rows = rows.where(ChannelHistory.scraped_at >= since)
+    return rows
+
+
+def category_daily_rows(since):
+    """
+    Aggregate the video rollup per category and day from `since` on.
+    """
+    rows = select(
+        VideoDaily.category_id,
+        VideoDaily.day,
+        func.count().label("video_count"),
+        func.sum(VideoDaily.view_count).label("view_count"),
+        func.sum(VideoDaily.like_count).label("like_count"),
+        func.sum(VideoDaily.comment_count).label("comment_count"),
+        func.sum(VideoDaily.view_count_delta).label("view_count_delta"),
+        func.sum(VideoDaily.like_count_delta).label("like_count_delta"),
+        func.sum(VideoDaily.comment_count_delta).label("comment_count_delta"),
+    ).where(VideoDaily.category_id.is_not(None))
+    if since is not None:
+        rows = rows.where(VideoDaily.day >= since)
+    return rows.group_by(VideoDaily.category_id, VideoDaily.day)
+
+
+def refresh_rollups(session, full=False):
+    """
+    Fold history rows newer than the watermark into the daily rollups.
+    Whole days are recomputed, starting from the day of the watermark, so
+    partially rolled-up days are completed rather than double counted.
+    """
+    watermark = None
+    if not full:
+        watermark = session.scalar(
+            select(IngestState.rollup_watermark).where(IngestState.id == 1)
+        )
+    since = cast(func.date_trunc("day", watermark), Date) if watermark else None
+
+    videos = upsert_from_select(session, VideoDaily, video_daily_rows(since))
+    channels = upsert_from_select(session, ChannelDaily, channel_daily_rows(since))
+    categories = upsert_from_select(session, CategoryDaily, category_daily_rows(since))
+
+    latest = session.scalar(
+        select(
+            func.greatest(
+                select(func.max(VideoHistory.scraped_at)).scalar_subquery(),
+                select(func.max(ChannelHistory.scraped_at)).scalar_subquery(),
+            )
+        )
+    )
+    if latest is not None:
+        stmt = pg_insert(IngestState).values(id=1, rollup_watermark=latest)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[IngestState.id],
+                set_={"rollup_watermark": stmt.excluded.rollup_watermark},
+            )
+        )
+    logger.info(
+        "Refreshed rollups",
+        extra={
+            "video_days": videos,
+            "channel_days": channels,
+            "category_days": categories,
+        },
+    )
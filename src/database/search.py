@@ -0,0 +1,61 @@
+# Full-text and tag search over the video tables.
+# Both video tables carry a search_vector (title, tags, description weighted
+# in that order, see models.py) and the untruncated tag_list, each with a GIN
+# index, so matching never scans the table.
+
+from sqlalchemy import and_, func, literal, select
+
+
+def search_statement(table, q=None, tags=(), limit=20, offset=0):
+    """
+    Build a query for videos matching a web-search style query and/or having
+    all of the given tags, best ranked first. A video matching in several
+    rows (charts, regions, snapshots) is returned once, as its latest row.
+    Matches are deduplicated and ranked on their keys and scores alone, and
+    only the rows of the requested page are read in full.
+    """
+    conditions = []
+    if q:
+        query = func.websearch_to_tsquery("english", q)
+        conditions.append(table.c.search_vector.op("@@")(query))
+        score = func.ts_rank_cd(table.c.search_vector, query)
+    else:
+        score = literal(0.0)
+    if tags:
+        conditions.append(table.c.tag_list.contains(list(tags)))
+
+    key = list(table.primary_key.columns)
+    latest = (
+        select(*key, table.c.video_id, score.label("score"))
+        .where(*conditions)
+        .distinct(table.c.video_id)
+        .order_by(table.c.video_id, table.c.scraped_at.desc())
+        .subquery("latest")
+    )
+    page = (
+        select(latest)
+        .order_by(latest.c.score.desc(), latest.c.video_id)
+        .offset(offset)
+        .limit(limit)
+        .subquery("page")
+    )
+    headline = (
+        func.ts_headline("english", table.c.description, query, "MaxFragments=2")
+        if q
+        else literal(None)
+    )
+    return (
+        select(
+            table.c.video_id,
+            table.c.title,
+            headline.label("headline"),
+            table.c.tag_list,
+            table.c.channel_id,
+            table.c.category_id,
+            table.c.view_count,
+            table.c.scraped_at,
+            page.c.score,
+        )
+        .join(page, and_(*(table.c[column.name] == page.c[column.name] for column in key)))
+        .order_by(page.c.score.desc(), page.c.video_id)
+    )
@@ -0,0 +1,4 @@
+import os
+
+# src.core.api builds its YouTube client at import, which needs some key
+os.environ.setdefault("YOUTUBE_API_KEY", "test")
@@ -0,0 +1,146 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+import src.core.api as api
+from src.core.scheduler import QuotaBudgetExceeded, RequestScheduler
+
+
+class FakeYouTube:
+    """
+    Local HTTP server answering YouTube API requests with scripted statuses,
+    then with pages of videos that always point to a next page.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.hits = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    fake.hits += 1
+                    status = fake.statuses.pop(0) if fake.statuses else 200
+                    page = fake.hits
+                body = {}
+                if status == 200:
+                    body = {
+                        "items": [
+                            {"id": f"video{page}", "snippet": {"channelId": "channel1"}}
+                        ],
+                        "nextPageToken": f"page{page}",
+                    }
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = build(
+            "youtube",
+            "v3",
+            developerKey="fake",
+            client_options={
+                "api_endpoint": f"http://127.0.0.1:{self.server.server_port}"
+            },
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_youtube():
+    servers = []
+
+    def start(statuses=()):
+        server = FakeYouTube(statuses)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def recording_backoff(scheduler):
+    """
+    Replace the scheduler's backoff with one that records attempts and
+    does not sleep.
+    """
+    attempts = []
+
+    def backoff(attempt):
+        attempts.append(attempt)
+        return 0
+
+    scheduler.backoff = backoff
+    return attempts
+
+
+def test_retries_transient_errors_with_backoff(fake_youtube):
+    youtube = fake_youtube([503, 429])
+    scheduler = RequestScheduler(rate=1000, burst=10, max_retries=3)
+    attempts = recording_backoff(scheduler)
+
+    response = scheduler.execute(youtube.client.videos().list(part="snippet"))
+
+    assert response["items"][0]["id"] == "video3"
+    assert youtube.hits == 3
+    assert attempts == [0, 1]
+    metrics = scheduler.metrics()
+    assert metrics["requests"] == 3
+    assert metrics["retries"] == 2
+    assert metrics["failures"] == 0
+    assert metrics["quota_spent"] == 3
+
+
+def test_gives_up_after_max_retries(fake_youtube):
+    youtube = fake_youtube([503] * 10)
+    scheduler = RequestScheduler(rate=1000, burst=10, max_retries=2)
+    attempts = recording_backoff(scheduler)
+
+    with pytest.raises(HttpError):
+        scheduler.execute(youtube.client.videos().list(part="snippet"))
+
+    assert youtube.hits == 3
+    assert attempts == [0, 1]
+    assert scheduler.metrics()["failures"] == 1
+
+
+def test_backoff_is_capped_full_jitter():
+    scheduler = RequestScheduler(backoff_base=1.0, backoff_max=4.0)
+    for attempt in range(8):
+        assert 0 <= scheduler.backoff(attempt) <= min(4.0, 2**attempt)
+
+
+def test_quota_budget_stops_the_scrape(fake_youtube, monkeypatch):
+    youtube = fake_youtube([503])
+    scheduler = RequestScheduler(rate=1000, burst=10, quota_budget=4, max_retries=3)
+    recording_backoff(scheduler)
+    monkeypatch.setattr(api, "youtube", youtube.client)
+    monkeypatch.setattr(api, "scheduler", scheduler)
+
+    # The chart pages forever, so only the budget can end it, and it must
+    # reach the caller instead of looking like an empty chart
+    with pytest.raises(QuotaBudgetExceeded):
+        api.scrape_data(category_id=10)
+
+    # The failed attempt was charged too: 503, then three pages
+    assert youtube.hits == 4
+    metrics = scheduler.metrics()
+    assert metrics["quota_spent"] == 4
+    assert metrics["retries"] == 1